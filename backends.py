@@ -0,0 +1,354 @@
+import os
+import cv2
+import time
+import shutil
+import argparse
+import numpy as np
+from detections import *
+from object_tracker import assign_nearest
+
+# Model sizes trained, stored as best-{size}.pt
+MODEL_SIZES = ('n', 's', 'm', 'l')
+
+# Inference backends and weight precisions a model can be exported to
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'int8')
+
+
+def model_path(size='l', backend='pytorch', precision='fp32', imgsz=640):
+    """
+    Return the path of a model variant.
+
+    Args:
+        size (str): Model size, one of MODEL_SIZES.
+        backend (str): Inference backend, one of BACKENDS.
+        precision (str): Weight precision of exported models, one of PRECISIONS.
+        imgsz (int): Input resolution of exported models.
+
+    Returns:
+        path (str): Path of the PyTorch checkpoint, ONNX file or OpenVINO model directory.
+    """
+    if backend == 'pytorch':
+        return f'best-{size}.pt'
+
+    # Exports take batches of any size, unlike the fixed batch of 1 of earlier exports, which are not reused
+    name = f'best-{size}-{imgsz}-{precision}-dynamic'
+    return f'{name}.onnx' if backend == 'onnx' else f'{name}_openvino_model'
+
+
+def read_frames(clip_path, max_frames, every=1):
+    """
+    Read frames from a video clip, resized to the 640x640 frames used by process_video.
+
+    Args:
+        clip_path (str): Path to the video clip.
+        max_frames (int): Maximum number of frames to read.
+        every (int): Keep only every n-th frame of the clip.
+
+    Yields:
+        frame (numpy.ndarray): Resized frame.
+    """
+    capture = cv2.VideoCapture(clip_path)
+    index = 0
+    count = 0
+
+    while count < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        index += 1
+        if (index - 1) % every == 0:
+            count += 1
+            yield cv2.resize(frame, (640, 640))
+
+    capture.release()
+
+
+def quantize_onnx(source, destination, calibration_clip, imgsz, max_frames=100):
+    """
+    Quantize an FP32 ONNX model to INT8, calibrating the activation ranges on frames of a video clip.
+
+    Args:
+        source (str): Path of the FP32 ONNX model.
+        destination (str): Path of the INT8 ONNX model.
+        calibration_clip (str): Path to a video clip from the cameras the model will run on.
+        imgsz (int): Input resolution of the model.
+        max_frames (int): Maximum number of calibration frames.
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnx.load(source).graph.input[0].name
+
+    class Frame_Reader(CalibrationDataReader):
+        """
+        Calibration data reader feeding frames preprocessed the way ultralytics feeds the model.
+        """
+
+        def __init__(self):
+            self.frames = read_frames(calibration_clip, max_frames, every=10)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            if frame is None:
+                return None
+            # The frames are square, so resizing them matches the letterbox of ultralytics
+            return {input_name: cv2.dnn.blobFromImage(frame, 1 / 255.0, (imgsz, imgsz), swapRB=True)}
+
+    quantize_static(source, destination, Frame_Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # Keep the class names, stride and input size that ultralytics stores in the model metadata
+    quantized = onnx.load(destination)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(onnx.load(source).metadata_props)
+    onnx.save(quantized, destination)
+
+
+def export_model(size='l', backend='onnx', precision='fp32', imgsz=640, calibration_data='BSU2CLASS/data.yaml',
+                 calibration_clip=None):
+    """
+    Export a PyTorch checkpoint to an ONNX or OpenVINO model that predicts batches of any size.
+
+    Args:
+        size (str): Model size, one of MODEL_SIZES.
+        backend (str): 'onnx' or 'openvino'.
+        precision (str): Weight precision, one of PRECISIONS.
+        imgsz (int): Input resolution of the exported model.
+        calibration_data (str): Dataset YAML used to calibrate INT8 OpenVINO models.
+        calibration_clip (str): Video clip used to calibrate INT8 ONNX models.
+
+    Returns:
+        path (str): Path of the exported model.
+    """
+    from ultralytics import YOLO
+
+    path = model_path(size, backend, precision, imgsz)
+    model = YOLO(model_path(size))
+
+    if backend == 'onnx':
+        # Export with a dynamic batch size, as every batch holds one frame per camera
+        exported = model.export(format='onnx', imgsz=imgsz, simplify=True, dynamic=True)
+
+        if precision == 'int8':
+            if calibration_clip is None:
+                raise ValueError("INT8 ONNX export needs a calibration clip")
+            quantize_onnx(exported, path, calibration_clip, imgsz)
+            os.remove(exported)
+        else:
+            os.replace(exported, path)
+    else:
+        exported = model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=precision == 'int8',
+                                data=calibration_data)
+
+        # Replace an earlier export of the same variant
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(exported, path)
+
+    print(f"Exported {model_path(size)} to {path}")
+    return path
+
+
+def ensure_model(size='l', backend='pytorch', precision='fp32', imgsz=640, calibration_data='BSU2CLASS/data.yaml',
+                 calibration_clip=None):
+    """
+    Export a model variant if it has not been exported yet.
+
+    Args:
+        size (str): Model size, one of MODEL_SIZES.
+        backend (str): Inference backend, one of BACKENDS.
+        precision (str): Weight precision of exported models, one of PRECISIONS.
+        imgsz (int): Input resolution of exported models.
+        calibration_data (str): Dataset YAML used to calibrate INT8 OpenVINO models.
+        calibration_clip (str): Video clip used to calibrate INT8 ONNX models.
+
+    Returns:
+        path (str): Path of the model variant.
+    """
+    path = model_path(size, backend, precision, imgsz)
+    if backend != 'pytorch' and not os.path.exists(path):
+        export_model(size, backend, precision, imgsz, calibration_data, calibration_clip)
+
+    return path
+
+
+def load_model(size='l', backend='pytorch', precision='fp32', imgsz=640, calibration_data='BSU2CLASS/data.yaml',
+               calibration_clip=None):
+    """
+    Load a detection model variant, exporting it first if it has not been exported yet.
+
+    All variants are loaded through ultralytics, so they share the predict API used by process_video.
+
+    Args:
+        size (str): Model size, one of MODEL_SIZES.
+        backend (str): Inference backend, one of BACKENDS.
+        precision (str): Weight precision of exported models, one of PRECISIONS.
+        imgsz (int): Input resolution of exported models.
+        calibration_data (str): Dataset YAML used to calibrate INT8 OpenVINO models.
+        calibration_clip (str): Video clip used to calibrate INT8 ONNX models.
+
+    Returns:
+        model: The object detection model.
+    """
+    from ultralytics import YOLO
+
+    path = ensure_model(size, backend, precision, imgsz, calibration_data, calibration_clip)
+    return YOLO(path, task='detect')
+
+
+def warm_up(model, imgsz=640, batch=1, runs=2):
+    """
+    Predict blank frames, so the first live frames do not wait for the lazy initialisation of the model.
+
+    The first predictions set up the predictor, fuse the layers or create the inference session and pick the
+    kernels for the input shape, which takes longer than many later predictions together.
+
+    Args:
+        model: The object detection model.
+        imgsz (int): Input resolution of the model.
+        batch (int): Number of frames per prediction, as in the live batches.
+        runs (int): Number of predictions.
+    """
+    # Stand-ins that need no warm-up, like the synthetic model of the benchmark, say so with their own method
+    if hasattr(model, 'warm_up'):
+        model.warm_up(imgsz, batch)
+        return
+
+    # Grey frames, the colour letterboxing pads with
+    frames = [np.full((640, 640, 3), 114, np.uint8) for _ in range(batch)]
+    for _ in range(runs):
+        model.predict(frames, imgsz=imgsz, verbose=False)
+
+
+def match_detections(reference_boxes, reference_categories, boxes, categories, iou_threshold=0.5):
+    """
+    Count the detections that match a reference detection of the same category.
+
+    Args:
+        reference_boxes (numpy.ndarray): Array of shape (N, 4) with [x1, y1, x2, y2] reference boxes.
+        reference_categories (numpy.ndarray): Compliance category of every reference box.
+        boxes (numpy.ndarray): Array of shape (M, 4) with [x1, y1, x2, y2] boxes to check.
+        categories (numpy.ndarray): Compliance category of every box to check.
+        iou_threshold (float): Minimum intersection over union of a matching pair.
+
+    Returns:
+        matched (int): Number of matched pairs.
+    """
+    if len(reference_boxes) == 0 or len(boxes) == 0:
+        return 0
+
+    a = reference_boxes[:, None, :].astype(np.float64)
+    b = boxes[None, :, :].astype(np.float64)
+
+    # Intersection over union of every reference box with every box
+    width = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    height = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = width * height
+    areas_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    areas_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    iou = intersection / np.maximum(areas_a + areas_b - intersection, 1e-9)
+
+    # Boxes of different categories never match
+    distances = np.where(reference_categories[:, None] == categories[None, :], 1.0 - iou, 1.0)
+    rows, _ = assign_nearest(distances, 1.0 - iou_threshold + 1e-9)
+    return len(rows)
+
+
+def check_accuracy(reference, model, clip_path, class_path, imgsz=640, max_frames=300, iou_threshold=0.5):
+    """
+    Compare the detections of a model variant with those of a reference model on a held-out clip.
+
+    The detections of the reference model are taken as ground truth, so the precision and recall show how
+    much accuracy the variant trades for its speed.
+
+    Args:
+        reference: Reference detection model, normally the PyTorch checkpoint.
+        model: Detection model variant to check.
+        clip_path (str): Path to a held-out video clip not used for training or calibration.
+        class_path (str): Path to the file containing classes to detect.
+        imgsz (int): Input resolution of the model variant.
+        max_frames (int): Maximum number of frames to compare.
+        iou_threshold (float): Minimum intersection over union of a matching detection.
+
+    Returns:
+        report (dict): Precision, recall, per-category counts and frames per second of both models.
+    """
+    class_table = load_class_table(class_path)
+    reference_counts = np.zeros(len(CATEGORIES), np.int64)
+    counts = np.zeros(len(CATEGORIES), np.int64)
+    matched = 0
+    reference_time = 0.0
+    model_time = 0.0
+    frame_count = 0
+
+    for frame in read_frames(clip_path, max_frames):
+        start = time.perf_counter()
+        reference_result = reference.predict(frame, imgsz=640, verbose=False)[0]
+        reference_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = model.predict(frame, imgsz=imgsz, verbose=False)[0]
+        model_time += time.perf_counter() - start
+
+        reference_boxes, reference_categories = parse_detections(reference_result.boxes.data, class_table)
+        boxes, categories = parse_detections(result.boxes.data, class_table)
+
+        reference_counts += np.bincount(reference_categories, minlength=len(CATEGORIES))
+        counts += np.bincount(categories, minlength=len(CATEGORIES))
+        matched += match_detections(reference_boxes, reference_categories, boxes, categories, iou_threshold)
+        frame_count += 1
+
+    return {
+        'frames': frame_count,
+        'precision': matched / max(int(counts.sum()), 1),
+        'recall': matched / max(int(reference_counts.sum()), 1),
+        'reference_counts': dict(zip(CATEGORIES, reference_counts.tolist())),
+        'counts': dict(zip(CATEGORIES, counts.tolist())),
+        'reference_fps': frame_count / max(reference_time, 1e-9),
+        'fps': frame_count / max(model_time, 1e-9),
+    }
+
+
+def main():
+    """
+    Export a model variant and check its accuracy and speed against the PyTorch checkpoint on a held-out clip.
+    """
+    parser = argparse.ArgumentParser(description="Export and check SMARTVIEW inference backends")
+    parser.add_argument('--model-size', choices=MODEL_SIZES, default='l',
+                        help="size of the model to export")
+    parser.add_argument('--backend', choices=BACKENDS[1:], default='openvino',
+                        help="backend to export the model to")
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32',
+                        help="weight precision of the exported model")
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help="input resolution of the exported model")
+    parser.add_argument('--calibration-data', default='BSU2CLASS/data.yaml',
+                        help="dataset YAML used to calibrate INT8 OpenVINO models")
+    parser.add_argument('--calibration-clip',
+                        help="video clip used to calibrate INT8 ONNX models")
+    parser.add_argument('--check', metavar='CLIP',
+                        help="held-out video clip to check the accuracy of the exported model on")
+    parser.add_argument('--reference-size', choices=MODEL_SIZES, default='l',
+                        help="size of the PyTorch model the exported model is checked against")
+    args = parser.parse_args()
+
+    export_model(args.model_size, args.backend, args.precision, args.imgsz, args.calibration_data,
+                 args.calibration_clip)
+
+    if args.check is None:
+        return
+
+    reference = load_model(args.reference_size)
+    model = load_model(args.model_size, args.backend, args.precision, args.imgsz)
+    report = check_accuracy(reference, model, args.check, 'smartview_classes.txt', imgsz=args.imgsz)
+
+    print(f"Checked {report['frames']} frames of {args.check} against {model_path(args.reference_size)}")
+    print(f"Precision: {report['precision']:.3f}  Recall: {report['recall']:.3f}")
+    print(f"Counts: {report['counts']}  Reference counts: {report['reference_counts']}")
+    print(f"FPS: {report['fps']:.1f}  Reference FPS: {report['reference_fps']:.1f}")
+
+
+if __name__ == "__main__":
+    # Call the main function when the script is executed
+    main()
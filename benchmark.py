@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import argparse
+import resource
+import numpy as np
+from uniform import *
+from functools import partial
+
+# File extensions of the clips replayed by the benchmark
+CLIP_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
+
+
+class Synthetic_Model:
+    """
+    Stand-in for the detection model that makes up people walking along the area, so the tracking and counting
+    stages can be benchmarked without model weights.
+
+    A new person enters from the left every spawn_every frames and walks along the area. Detections are
+    jittered and sometimes missed like those of a real detector, and the number of people whose center
+    entered the area is kept per compliance category as the ground truth of the clip. The people move on
+    every predicted frame, so the model is meant to run without frame skipping and without cropping.
+
+    Attributes:
+        zone (Zone): Area of interest the ground truth is counted in.
+        names (dict): Dictionary mapping the class IDs used to their class names.
+        ground_truth (numpy.ndarray): Number of people that entered the area per compliance category.
+    """
+
+    def __init__(self, zone, class_table, spawn_every=15, speed=6.0, miss_rate=0.05, jitter=2.0, seed=0):
+        """
+        Initialize Synthetic_Model with nobody in view.
+
+        Args:
+            zone (Zone): Area of interest the ground truth is counted in.
+            class_table (numpy.ndarray): Table mapping class IDs to compliance categories.
+            spawn_every (int): Number of frames between two people entering the view.
+            speed (float): Walking speed in pixels per frame.
+            miss_rate (float): Fraction of detections that are missed.
+            jitter (float): Standard deviation in pixels of the noise added to the boxes.
+            seed (int): Seed of the random generator, so every run makes up the same people.
+        """
+        self.zone = zone
+        self.class_ids = [int(np.flatnonzero(class_table == category)[0]) for category in range(len(CATEGORIES))]
+        self.names = {class_id: CATEGORIES[category] for category, class_id in enumerate(self.class_ids)}
+        self.spawn_every = spawn_every
+        self.speed = speed
+        self.miss_rate = miss_rate
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+        self.frame_count = 0
+
+        # Center point, compliance category and whether each person has been counted, one row per person
+        self.centers = np.empty((0, 2), np.float64)
+        self.categories = np.empty(0, np.int64)
+        self.counted = np.empty(0, bool)
+        self.ground_truth = np.zeros(len(CATEGORIES), np.int64)
+
+        # Walk along the middle line of the area polygon
+        x, y, w, h = cv2.boundingRect(zone.polygon)
+        self.start_y = y + h * 0.3
+        self.slope = h * 0.4 / max(w, 1)
+
+    def step(self):
+        """
+        Move everyone by one frame and make up the detections of the frame.
+
+        Returns:
+            data (numpy.ndarray): Detections of shape (N, 6) in the format [x1, y1, x2, y2, confidence, class_id].
+        """
+        self.frame_count += 1
+
+        # Let a new person enter from the left
+        if self.frame_count % self.spawn_every == 1:
+            offset = self.rng.uniform(-3.0, 3.0)
+            self.centers = np.vstack((self.centers, [[-20.0, self.start_y + offset]]))
+            self.categories = np.append(self.categories, self.rng.integers(len(CATEGORIES)))
+            self.counted = np.append(self.counted, False)
+
+        # Walk to the right and forget those who left the frame
+        self.centers += [self.speed, self.speed * self.slope]
+        keep = self.centers[:, 0] < 680
+        self.centers, self.categories, self.counted = self.centers[keep], self.categories[keep], self.counted[keep]
+
+        # Count the people whose center entered the area for the first time
+        entered = self.zone.contains(np.rint(self.centers).astype(np.int64)) & ~self.counted
+        self.ground_truth += np.bincount(self.categories[entered], minlength=len(CATEGORIES))
+        self.counted |= entered
+
+        # Make up a 40x120 box around every person that is detected
+        seen = self.rng.random(len(self.centers)) >= self.miss_rate
+        centers = self.centers[seen] + self.rng.normal(0.0, self.jitter, (int(seen.sum()), 2))
+        data = np.empty((len(centers), 6), np.float32)
+        data[:, 0:2] = centers - [20, 60]
+        data[:, 2:4] = centers + [20, 60]
+        data[:, 4] = 0.9
+        data[:, 5] = np.array(self.class_ids)[self.categories[seen]]
+        return data
+
+    def predict(self, frames, imgsz=640, **kwargs):
+        """
+        Make up the detections of a batch of frames, like the predict method of a YOLO model.
+
+        Args:
+            frames (list): List of frames.
+            imgsz (int): Input resolution, ignored.
+
+        Returns:
+            results (list): List of Mapped_Result objects, one per frame.
+        """
+        return [Mapped_Result(frame, self.step(), self.names) for frame in frames]
+
+    def warm_up(self, imgsz=640, batch=1):
+        """
+        Skip the warm-up of process_video, which would otherwise move the made-up people before the clip starts.
+
+        Args:
+            imgsz (int): Input resolution, ignored.
+            batch (int): Number of frames per prediction, ignored.
+        """
+        pass
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of the process.
+
+    Returns:
+        peak (float): Peak resident set size in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_clip(clip_path, model, class_path, area, line, options):
+    """
+    Replay a clip through the pipeline as fast as possible and measure it.
+
+    Args:
+        clip_path (str): Path to the video clip.
+        model: Detection model, or None to make up the detections with a Synthetic_Model.
+        class_path (str): Path to the file containing classes to detect.
+        area (list): List of points defining the area polygon.
+        line (tuple): Start and end point of the counting line, or None to count by presence in the area.
+        options (dict): Keyword arguments passed on to process_video.
+
+    Returns:
+        result (dict): Frames, startup and replay seconds, FPS, latency percentiles, counts and the ground truth if
+            known of the clip.
+    """
+    name = os.path.splitext(os.path.basename(clip_path))[0]
+    camera = Camera_Stream(name, clip_path, area, None, line)
+
+    synthetic = None
+    if model is None:
+        synthetic = model = Synthetic_Model(camera.zone, load_class_table(class_path))
+
+    # Replay every frame of the clip without a display, recording, reports or metrics endpoint
+    latencies = []
+    startup = Startup_Timer()
+    process_video([camera], class_path, model, display=False, record='off', metrics_port=0, keep_latest=False,
+                  reports=False, latencies=latencies, startup=startup, **options)
+    end = time.perf_counter()
+
+    # Time the replay from when the stream was opened, leaving out the warm-up before it
+    startup_seconds = sum(seconds for phase, seconds in startup.phases if phase != "first frame")
+    seconds = end - startup.start - startup_seconds
+
+    result = {
+        'clip': os.path.basename(clip_path),
+        'frames': len(latencies),
+        'startup_seconds': round(startup_seconds, 3),
+        'seconds': round(seconds, 3),
+        'fps': round(len(latencies) / seconds, 2) if seconds > 0 else 0.0,
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2) if latencies else None,
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 2) if latencies else None,
+        'counts': dict(zip(CATEGORIES, camera.counts.tolist())),
+    }
+    if synthetic is not None:
+        result['ground_truth'] = dict(zip(CATEGORIES, synthetic.ground_truth.tolist()))
+
+    return result
+
+
+def compare_counts(counts, ground_truth):
+    """
+    Compare counts with ground-truth counts.
+
+    Args:
+        counts (dict): Dictionary mapping every compliance category to its count.
+        ground_truth (dict): Dictionary mapping every compliance category to its true count.
+
+    Returns:
+        comparison (dict): Error per category, absolute error and count accuracy.
+    """
+    errors = {category: counts.get(category, 0) - ground_truth.get(category, 0) for category in CATEGORIES}
+    absolute_error = sum(abs(error) for error in errors.values())
+    true_total = sum(ground_truth.get(category, 0) for category in CATEGORIES)
+    return {
+        'errors': errors,
+        'absolute_error': absolute_error,
+        'accuracy': round(1.0 - absolute_error / true_total, 4) if true_total else None,
+    }
+
+
+def main():
+    """
+    Benchmark the counting pipeline over a directory of recorded clips and save the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the SMARTVIEW pipeline on recorded clips")
+    parser.add_argument('clips', help="directory of video clips to replay")
+    parser.add_argument('--output', default='benchmark.json',
+                        help="JSON file the results are written to")
+    parser.add_argument('--ground-truth',
+                        help="JSON file mapping clip file names to their true counts per category")
+    parser.add_argument('--synthetic', action='store_true',
+                        help="make up detections instead of loading a model, with their own ground truth")
+    parser.add_argument('--config', default=CONFIG_PATH,
+                        help="camera config the area and counting line are taken from")
+    parser.add_argument('--camera',
+                        help="camera of the config whose area and counting line are used, by default the first")
+    parser.add_argument('--area', type=json.loads,
+                        help="area polygon as a JSON list of [x, y] points, instead of the camera's")
+    parser.add_argument('--line', type=json.loads,
+                        help="counting line as a JSON list of two [x, y] points, instead of the camera's")
+    parser.add_argument('--class-path', default='smartview_classes.txt',
+                        help="file containing the classes to detect")
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch',
+                        help="inference backend")
+    parser.add_argument('--model-size', choices=MODEL_SIZES, default='l',
+                        help="size of the detection model")
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32',
+                        help="weight precision of exported models")
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help="input resolution of the model")
+    parser.add_argument('--crop', action='store_true',
+                        help="run the detector on a letterboxed region around the area only")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="skip the detector while nothing moves around the area")
+    parser.add_argument('--max-skip', type=int, default=1,
+                        help="largest number of frames per inference when the detector is slow")
+    parser.add_argument('--annotate-every', type=int, default=0,
+                        help="annotate every n-th frame to include the annotation cost, 0 to never annotate")
+    parser.add_argument('--hair-model',
+                        help="hair colour classification model of the second-stage hair check")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="number of inference processes, 0 to run capture and inference in threads")
+    args = parser.parse_args()
+
+    if args.synthetic and (args.crop or args.max_skip > 1 or args.workers):
+        parser.error("--synthetic makes up one frame of detections per prediction in this process, without --crop, "
+                     "--max-skip or --workers")
+
+    clips = sorted(os.path.join(args.clips, file_name) for file_name in os.listdir(args.clips)
+                   if file_name.lower().endswith(CLIP_EXTENSIONS))
+    if not clips:
+        parser.error(f"No clips found in {args.clips}")
+
+    ground_truth = {}
+    if args.ground_truth:
+        with open(args.ground_truth, "r") as ground_truth_file:
+            ground_truth = json.load(ground_truth_file)
+
+    # Load the model once for all clips, or let every inference process load its own copy
+    model = None
+    if args.workers:
+        ensure_model(args.model_size, args.backend, args.precision, args.imgsz)
+        model = partial(load_model, args.model_size, args.backend, args.precision, args.imgsz)
+    elif not args.synthetic:
+        model = load_model(args.model_size, args.backend, args.precision, args.imgsz)
+
+    # Take the area and counting line of a calibrated camera unless they are given
+    if args.area is None:
+        cameras = {name: (camera_area, camera_line) for name, _, camera_area, camera_line in load_cameras(args.config)}
+        name = args.camera or next(iter(cameras))
+        if name not in cameras:
+            parser.error(f"Camera {name} is not in {args.config}")
+        area, line = cameras[name]
+    else:
+        area, line = [tuple(point) for point in args.area], None
+    if args.line:
+        line = tuple(tuple(point) for point in args.line)
+    options = dict(annotate_every=args.annotate_every, imgsz=args.imgsz, motion_gate=args.motion_gate,
+                   max_skip=args.max_skip, crop=args.crop, workers=args.workers,
+                   hair_model=load_hair_model(args.hair_model) if args.hair_model else None)
+
+    results = []
+    for clip_path in clips:
+        result = run_clip(clip_path, model, args.class_path, area, line, options)
+
+        if result['clip'] in ground_truth:
+            result['ground_truth'] = ground_truth[result['clip']]
+        if 'ground_truth' in result:
+            result.update(compare_counts(result['counts'], result['ground_truth']))
+
+        result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        results.append(result)
+        print(f"{result['clip']}: {result['frames']} frames at {result['fps']} FPS, "
+              f"p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, counts {result['counts']}"
+              + (f", ground truth {result['ground_truth']}" if 'ground_truth' in result else ""))
+
+    # Summarize all clips
+    frames = sum(result['frames'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    summary = {
+        'frames': frames,
+        'seconds': round(seconds, 3),
+        'fps': round(frames / seconds, 2) if seconds > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    compared = [result for result in results if 'absolute_error' in result]
+    if compared:
+        summary['absolute_error'] = sum(result['absolute_error'] for result in compared)
+        true_total = sum(sum(result['ground_truth'].get(category, 0) for category in CATEGORIES)
+                         for result in compared)
+        summary['accuracy'] = round(1.0 - summary['absolute_error'] / true_total, 4) if true_total else None
+
+    config = vars(args)
+    config['model'] = 'synthetic' if args.synthetic else model_path(args.model_size, args.backend, args.precision,
+                                                                   args.imgsz)
+
+    with open(args.output, "w") as output_file:
+        json.dump({'config': config, 'clips': results, 'summary': summary}, output_file, indent=2)
+
+    print(f"{frames} frames at {summary['fps']} FPS, peak RSS {summary['peak_rss_mb']} MB"
+          + (f", count accuracy {summary['accuracy']}" if 'accuracy' in summary else ""))
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    # Call the main function when the script is executed
+    main()
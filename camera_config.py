@@ -0,0 +1,81 @@
+import os
+import json
+
+# Path of the camera config saved by draw_area.py and loaded by uniform.py and benchmark.py
+CONFIG_PATH = "cameras.json"
+
+
+def parse_stream(stream_path):
+    """
+    Turn the index of a local camera given as text, like "1", into an int, as cv2.VideoCapture only opens
+    cameras by an integer index.
+
+    Args:
+        stream_path (str): Path or URL of the video stream, or the index of a local camera.
+
+    Returns:
+        stream_path: The camera index as an int, or the path or URL unchanged.
+    """
+    if isinstance(stream_path, str) and stream_path.isdigit():
+        return int(stream_path)
+    return stream_path
+
+
+def load_cameras(path=CONFIG_PATH):
+    """
+    Load the stream, area polygon and counting line of every camera from a config file.
+
+    The file is a JSON object mapping camera names to {"stream": ..., "area": [[x, y], ...], "line": ...}
+    entries, with points in the coordinates of the 640x640 frames, line null to count by presence and the
+    stream a number for a local camera.
+
+    Args:
+        path (str): Path of the config file.
+
+    Returns:
+        cameras (list): List of (name, stream_path, area, line) tuples in the order of the file, with area a
+            list of (x, y) points and line a (start, end) tuple or None.
+    """
+    with open(path) as config_file:
+        config = json.load(config_file)
+
+    cameras = []
+    for name, camera in config.items():
+        area = [tuple(point) for point in camera["area"]]
+        line = tuple(tuple(point) for point in camera["line"]) if camera.get("line") else None
+        cameras.append((name, parse_stream(camera["stream"]), area, line))
+
+    return cameras
+
+
+def save_camera(name, stream_path, area, line=None, path=CONFIG_PATH):
+    """
+    Add a camera to the config file, or replace its entry, keeping the other cameras.
+
+    Args:
+        name (str): Name of the camera.
+        stream_path (str): Path to the video stream of the camera, or the index of a local camera.
+        area (list): List of points defining the area polygon.
+        line (tuple): Start and end point of the counting line, or None to count by presence in the area.
+        path (str): Path of the config file.
+    """
+    config = {}
+    if os.path.exists(path):
+        with open(path) as config_file:
+            config = json.load(config_file)
+
+    config[name] = {
+        "stream": parse_stream(stream_path),
+        "area": [[int(x), int(y)] for x, y in area],
+        "line": [[int(x), int(y)] for x, y in line] if line is not None else None,
+    }
+
+    # One camera per line keeps the file easy to read and edit by hand
+    text = "{\n" + ",\n".join(f"    {json.dumps(camera_name)}: {json.dumps(camera)}"
+                               for camera_name, camera in config.items()) + "\n}\n"
+
+    # Write to a temporary file first, so a crash never leaves a half written config behind
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as config_file:
+        config_file.write(text)
+    os.replace(temporary_path, path)
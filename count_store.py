@@ -0,0 +1,205 @@
+import csv
+import sqlite3
+import threading
+from datetime import timedelta
+from detections import CATEGORIES
+
+# Format of the minute timestamps in the store, which sorts chronologically as text
+MINUTE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class Count_Store:
+    """
+    Class for storing the counts of every camera per minute and per compliance category in a local SQLite database.
+
+    The database uses write-ahead logging, so reports can read it while counts are being appended, and
+    totals and reports are computed locally without any network round trip.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path="smartview_counts.db"):
+        """
+        Initialize Count_Store and create the database if it does not exist.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS counts (
+                minute TEXT NOT NULL,
+                camera TEXT NOT NULL,
+                category TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (minute, camera, category)
+            ) WITHOUT ROWID
+        """)
+        self.connection.commit()
+
+    def add(self, camera, counts, when):
+        """
+        Add the objects counted by a camera to the minute they were counted in.
+
+        Args:
+            camera (str): Name of the camera.
+            counts (numpy.ndarray): Number of objects counted per compliance category.
+            when (datetime): Time within the minute the objects were counted in.
+        """
+        minute = when.strftime(MINUTE_FORMAT)
+        rows = [(minute, camera, category, int(count)) for category, count in zip(CATEGORIES, counts) if count]
+        if not rows:
+            return
+
+        with self.lock:
+            self.connection.executemany("""
+                INSERT INTO counts (minute, camera, category, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (minute, camera, category) DO UPDATE SET count = count + excluded.count
+            """, rows)
+            self.connection.commit()
+
+    def totals(self, start, end, camera=None):
+        """
+        Calculate the number of objects counted per compliance category between two times.
+
+        Args:
+            start (datetime): Start of the period, inclusive.
+            end (datetime): End of the period, exclusive.
+            camera (str): Name of the camera, or None for all cameras.
+
+        Returns:
+            totals (dict): Dictionary mapping every compliance category to its count.
+        """
+        query = "SELECT category, SUM(count) FROM counts WHERE minute >= ? AND minute < ?"
+        parameters = [start.strftime(MINUTE_FORMAT), end.strftime(MINUTE_FORMAT)]
+        if camera is not None:
+            query += " AND camera = ?"
+            parameters.append(camera)
+
+        with self.lock:
+            rows = self.connection.execute(query + " GROUP BY category", parameters).fetchall()
+
+        totals = dict.fromkeys(CATEGORIES, 0)
+        totals.update(rows)
+        return totals
+
+    def report_rows(self, start, end, period="hour", chunk_size=1000):
+        """
+        Yield the counts per camera and per hour or day between two times, ordered by camera and time.
+
+        The rows are read through a separate connection in chunks of chunk_size rows, so reports of any length
+        use a constant amount of memory and never hold up the counts being appended.
+
+        Args:
+            start (datetime): Start of the period, inclusive.
+            end (datetime): End of the period, exclusive.
+            period (str): 'hour' or 'day', the period every row is counted over.
+            chunk_size (int): Number of rows read at a time.
+
+        Yields:
+            row (tuple): Camera, start of the hour or day, and the count of every compliance category.
+        """
+        length = {"hour": 13, "day": 10}[period]
+        suffix = ":00" if period == "hour" else ""
+        sums = ", ".join(f"SUM(CASE WHEN category = '{category}' THEN count ELSE 0 END)" for category in CATEGORIES)
+
+        connection = sqlite3.connect(self.path)
+        try:
+            cursor = connection.execute(f"""
+                SELECT camera, substr(minute, 1, {length}) || '{suffix}' AS period, {sums}
+                FROM counts WHERE minute >= ? AND minute < ?
+                GROUP BY camera, period ORDER BY camera, period
+            """, (start.strftime(MINUTE_FORMAT), end.strftime(MINUTE_FORMAT)))
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            connection.close()
+
+    def export(self, start, end, file_name, period="hour"):
+        """
+        Save the counts of every camera per hour or day between two times as an Excel or CSV file.
+
+        Excel files get one worksheet per camera and are written in write-only mode, so rows are streamed to
+        the file instead of being kept in memory. A file name ending in .csv saves all cameras in one CSV file.
+
+        Args:
+            start (datetime): Start of the period, inclusive.
+            end (datetime): End of the period, exclusive.
+            file_name (str): Name of the .xlsx or .csv file.
+            period (str): 'hour' or 'day', the period every row is counted over.
+        """
+        header = ([period.capitalize()] + [category.upper() for category in CATEGORIES] +
+                  ["Compliant", "Non-compliant"])
+
+        def report_row(row):
+            # Add the compliant and non-compliant totals after the counts of every category
+            counts = dict(zip(CATEGORIES, row[2:]))
+            return list(row[1:]) + [counts['bsufcomply'] + counts['bsumcomply'], counts['bsunoncomply']]
+
+        rows = self.report_rows(start, end, period)
+
+        if file_name.endswith(".csv"):
+            with open(file_name, "w", newline="") as csv_file:
+                csv_writer = csv.writer(csv_file)
+                csv_writer.writerow(["Camera"] + header)
+                for row in rows:
+                    csv_writer.writerow([row[0]] + report_row(row))
+        else:
+            # openpyxl is only imported when a report is exported, as it slows down startup
+            from openpyxl import Workbook
+
+            # Create Excel workbook in write-only mode with a worksheet per camera
+            wb = Workbook(write_only=True)
+            ws = None
+            for row in rows:
+                if ws is None or ws.title != row[0][:31]:
+                    ws = wb.create_sheet(row[0][:31])
+                    ws.append(header)
+                ws.append(report_row(row))
+
+            # A workbook needs at least one worksheet
+            if ws is None:
+                wb.create_sheet("No data").append(header)
+
+            # Save Excel workbook
+            wb.save(file_name)
+
+        print(f'Report saved successfully as "{file_name}".')
+
+    def export_day(self, day, file_name):
+        """
+        Save the hourly counts of every camera on a day.
+
+        Args:
+            day (datetime): Any time on the day to export.
+            file_name (str): Name of the .xlsx or .csv file.
+        """
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.export(start, start + timedelta(days=1), file_name, period="hour")
+
+    def export_week(self, day, file_name):
+        """
+        Save the daily counts of every camera in the week, from Monday, of a day.
+
+        Args:
+            day (datetime): Any time in the week to export.
+            file_name (str): Name of the .xlsx or .csv file.
+        """
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=day.weekday())
+        self.export(start, start + timedelta(days=7), file_name, period="day")
+
+    def close(self):
+        """
+        Close the database.
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+from types import SimpleNamespace
+
+# Compliance categories, in the order the per-category box arrays are returned
+CATEGORIES = ['bsufcomply', 'bsumcomply', 'bsunoncomply']
+
+
+def load_class_table(class_path):
+    """
+    Build a table mapping every class ID of the model to its compliance category.
+
+    Args:
+        class_path (str): Path to the file containing classes to detect.
+
+    Returns:
+        class_table (numpy.ndarray): Category index of every class ID, or -1 for classes outside all categories.
+    """
+    # Read class data from file
+    with open(class_path, "r") as my_file:
+        class_list = my_file.read().split("\n")
+
+    class_table = np.full(len(class_list), -1, np.int64)
+    for class_id, class_name in enumerate(class_list):
+        for category, category_name in enumerate(CATEGORIES):
+            if category_name in class_name:
+                class_table[class_id] = category
+                break
+
+    return class_table
+
+
+def to_numpy(data):
+    """
+    Convert a detection tensor to a NumPy array.
+
+    Args:
+        data: Tensor or array of detections in the format [x1, y1, x2, y2, confidence, class_id].
+
+    Returns:
+        data (numpy.ndarray): Detections as a float32 array of shape (N, 6).
+    """
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    return np.asarray(data, np.float32).reshape(-1, 6)
+
+
+def parse_detections(data, class_table):
+    """
+    Extract the bounding boxes and compliance categories of the detections of a frame.
+
+    Args:
+        data: Tensor or array of detections in the format [x1, y1, x2, y2, confidence, class_id].
+        class_table (numpy.ndarray): Table returned by load_class_table.
+
+    Returns:
+        boxes (numpy.ndarray): Integer array of shape (M, 4) with [x1, y1, x2, y2] rows.
+        categories (numpy.ndarray): Compliance category of every box.
+    """
+    data = to_numpy(data)
+    boxes = data[:, :4].astype(np.int64)
+    class_ids = data[:, 5].astype(np.int64)
+
+    # Look up the category of every detection, ignoring class IDs missing from the table
+    known = (class_ids >= 0) & (class_ids < len(class_table))
+    categories = np.full(len(class_ids), -1, np.int64)
+    categories[known] = class_table[class_ids[known]]
+
+    # Drop detections outside all compliance categories
+    keep = categories >= 0
+    return boxes[keep], categories[keep]
+
+
+class Mapped_Result:
+    """
+    Class for detections mapped back from a cropped detector input to the full frame, offering the parts of an
+    ultralytics result used when counting and annotating.
+
+    Attributes:
+        orig_img (numpy.ndarray): Frame the detections are mapped to.
+        boxes: Object whose data attribute holds the detections in the format
+            [x1, y1, x2, y2, confidence, class_id].
+        names (dict): Dictionary mapping class IDs to class names.
+    """
+
+    def __init__(self, frame, data, names):
+        """
+        Initialize Mapped_Result.
+
+        Args:
+            frame (numpy.ndarray): Frame the detections are mapped to.
+            data (numpy.ndarray): Detections of shape (N, 6) on the frame.
+            names (dict): Dictionary mapping class IDs to class names.
+        """
+        self.orig_img = frame
+        self.boxes = SimpleNamespace(data=data)
+        self.names = names
+
+    def plot(self):
+        """
+        Draw the detections with their class name and confidence on a copy of the frame.
+
+        Returns:
+            annotated_frame (numpy.ndarray): Frame with the detections drawn.
+        """
+        annotated_frame = self.orig_img.copy()
+
+        for x1, y1, x2, y2, confidence, class_id in to_numpy(self.boxes.data).tolist():
+            label = f"{self.names.get(int(class_id), int(class_id))} {confidence:.2f}"
+            cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 128, 0), 2)
+            cv2.putText(annotated_frame, label, (int(x1), max(int(y1) - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (255, 128, 0), 1, cv2.LINE_AA)
+
+        return annotated_frame
@@ -1,90 +1,196 @@
+import os
 import cv2
+import argparse
 import numpy as np
-import pandas as pd
-from ultralytics import YOLO
+from roi import *
+from camera_config import *
 
-# Load YOLO model
-model = YOLO('MODELS/best-tune-70.pt')
+# Keys of the calibration window
+HELP = "left click: add point | a: area | l: line | u: undo | c: clear | s: save | Esc: quit"
 
-def RGB(event, x, y, flags, param):
+
+def grab_frame(stream_path, seek=0.0, attempts=50):
     """
-    Callback function to get RGB values when mouse moves over the window.
+    Grab one frame of a video stream, resized to the 640x640 frames the areas are defined on.
 
     Args:
-        event (int): Type of mouse event.
-        x (int): x-coordinate of the mouse pointer.
-        y (int): y-coordinate of the mouse pointer.
-        flags (int): Additional flags.
-        param: Additional parameters.
+        stream_path: Path to the video stream, or the index of a local camera as an int or text.
+        seek (float): Number of seconds to skip into a video file, to find a frame showing the gate clearly.
+        attempts (int): Number of reads before giving up, as live streams may not return the first frames.
+
+    Returns:
+        frame (numpy.ndarray): The resized frame, or None if the stream gave no frame.
+    """
+    cap = cv2.VideoCapture(parse_stream(stream_path))
+    if seek:
+        cap.set(cv2.CAP_PROP_POS_MSEC, seek * 1000)
+
+    frame = None
+    for _ in range(attempts):
+        ret, frame = cap.read()
+        if ret:
+            break
+        frame = None
+
+    cap.release()
+    return cv2.resize(frame, (640, 640)) if frame is not None else None
+
+
+class Calibration:
+    """
+    Class for the area polygon and counting line of one camera, clicked out on a still frame.
+
+    Attributes:
+        frame (numpy.ndarray): Frame the shapes are drawn on.
+        area (list): List of (x, y) points of the area polygon.
+        line (list): List of up to two (x, y) points of the counting line.
+        mode (str): 'area' or 'line', the shape new points are added to.
+        pointer (tuple): Last position of the mouse pointer.
+    """
+
+    def __init__(self, frame, area=None, line=None):
+        """
+        Initialize Calibration, starting from the saved shapes of the camera if any.
+
+        Args:
+            frame (numpy.ndarray): Frame the shapes are drawn on.
+            area (list): List of points of the saved area polygon, or None.
+            line (tuple): Start and end point of the saved counting line, or None.
+        """
+        self.frame = frame
+        self.area = list(area or [])
+        self.line = list(line or [])
+        self.mode = 'area'
+        self.pointer = (0, 0)
+
+    def on_mouse(self, event, x, y, flags, param):
+        """
+        Mouse callback adding a point to the current shape on a left click.
+
+        Args:
+            event (int): Type of mouse event.
+            x (int): x-coordinate of the mouse pointer.
+            y (int): y-coordinate of the mouse pointer.
+            flags (int): Additional flags.
+            param: Additional parameters.
+        """
+        self.pointer = (x, y)
+        if event != cv2.EVENT_LBUTTONDOWN:
+            return
+
+        if self.mode == 'area':
+            self.area.append((x, y))
+        else:
+            # A third click starts a new line
+            if len(self.line) == 2:
+                self.line = []
+            self.line.append((x, y))
+
+    def key(self, key):
+        """
+        Handle a key press of the calibration window.
+
+        Args:
+            key (int): Code of the pressed key.
+        """
+        if key == ord('a'):
+            self.mode = 'area'
+        elif key == ord('l'):
+            self.mode = 'line'
+        elif key in (ord('u'), 8):
+            # Undo the last point of the current shape
+            points = self.area if self.mode == 'area' else self.line
+            if points:
+                points.pop()
+        elif key == ord('c'):
+            if self.mode == 'area':
+                self.area = []
+            else:
+                self.line = []
+
+    def render(self):
+        """
+        Draw the shapes, the pointer coordinates and the keys on a copy of the frame.
+
+        Returns:
+            frame (numpy.ndarray): The annotated copy of the frame.
+        """
+        frame = self.frame.copy()
+
+        # Draw the area as it will be counted once it is a polygon, and as an open outline before
+        if len(self.area) >= 3:
+            Zone(self.area).draw(frame, thickness=2)
+        elif self.area:
+            cv2.polylines(frame, [np.array(self.area, np.int32)], False, (0, 255, 0), 2)
+        for point in self.area:
+            cv2.circle(frame, point, 4, (0, 255, 0), -1)
+
+        # Draw the counting line with the arrow pointing in the counted direction
+        if len(self.line) == 2 and self.line[0] != self.line[1]:
+            Counting_Line(*self.line).draw(frame)
+        for point in self.line:
+            cv2.circle(frame, point, 4, (0, 255, 255), -1)
+
+        cv2.putText(frame, f"{self.mode} {self.pointer}", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        cv2.putText(frame, HELP, (10, 630), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        return frame
+
+
+def main():
+    """
+    Calibrate the area polygon and counting line of a camera on one frame of its stream, without loading the
+    detection model, and save them to the camera config.
     """
-    if event == cv2.EVENT_MOUSEMOVE:
-        colorsBGR = [x, y]
-        print(colorsBGR)
-
-# Create a window and set mouse callback function
-cv2.namedWindow('AREA')
-cv2.setMouseCallback('AREA', RGB)
-
-# Open video capture
-cap = cv2.VideoCapture(1)
-
-# Read class names from file
-with open("smartview_classes.txt", "r") as my_file:
-    data = my_file.read()
-    class_list = data.split("\n")
-
-# Define lists to store bounding boxes for different classes
-bounding_list = []
-bounding_list1 = []
-bounding_list2 = []
-
-# Define area of interest polygon
-area = [(0, 310), (0, 370), (628, 390), (615, 375)]
-# Store counted areas
-area_c = set()
-
-while True:
-    ret, frame = cap.read()
-
-    if not ret:
-        break
-
-    # Resize frame
-    frame = cv2.resize(frame, (640, 640))
-
-    # Predict using YOLO model
-    results = model.predict(frame)
-    boxes = results[0].boxes.boxes
-
-    # Convert predicted boxes to DataFrame
-    px = pd.DataFrame(boxes).astype("float")
-
-    # Iterate through each bounding box
-    for index, row in px.iterrows():
-        x1, y1, x2, y2, _, d = map(int, row)
-        c = class_list[d]
-
-        # Check the class name and append the bounding box to respective lists
-        if 'bsufcomply' in c:
-            bounding_list.append([x1, y1, x2, y2])
-        elif 'bsumcomply' in c:
-            bounding_list1.append([x1, y1, x2, y2])
-        elif 'bsunoncomply' in c:
-            bounding_list2.append([x1, y1, x2, y2])
-
-    # Draw area of interest polygon on frame
-    cv2.polylines(frame, [np.array(area, np.int32)], True, (255, 255, 0), 1)
-    count = len(area_c)
-    # Display count of detected areas
-    cv2.putText(frame, str(count), (50, 80), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 0, 0), 1)
-
-    # Display frame
-    cv2.imshow("AREA", frame)
-
-    # Break loop on ESC key press
-    if cv2.waitKey(0) & 0xFF == 27:
-        break
-
-# Release video capture and close windows
-cap.release()
-cv2.destroyAllWindows()
+    parser = argparse.ArgumentParser(description="Click out the area and counting line of a SMARTVIEW camera")
+    parser.add_argument('name',
+                        help="name of the camera in the config")
+    parser.add_argument('--stream',
+                        help="video stream or local camera index, by default the saved stream of the camera")
+    parser.add_argument('--config', default=CONFIG_PATH,
+                        help="camera config the shapes are saved to")
+    parser.add_argument('--seek', type=float, default=0.0,
+                        help="seconds to skip into a video file before grabbing the frame")
+    args = parser.parse_args()
+
+    # Start from the saved stream and shapes of the camera
+    saved = {}
+    if os.path.exists(args.config):
+        saved = {name: (stream_path, area, line) for name, stream_path, area, line in load_cameras(args.config)}
+    stream_path, area, line = saved.get(args.name, (None, None, None))
+    stream_path = parse_stream(args.stream) if args.stream else stream_path
+    if stream_path is None:
+        parser.error(f"Camera {args.name} is not in {args.config}, give its --stream")
+
+    frame = grab_frame(stream_path, args.seek)
+    if frame is None:
+        print(f"An error occurred: Unable to read a frame from {stream_path}")
+        return
+
+    calibration = Calibration(frame, area, line)
+    cv2.namedWindow('AREA')
+    cv2.setMouseCallback('AREA', calibration.on_mouse)
+
+    while True:
+        cv2.imshow('AREA', calibration.render())
+        key = cv2.waitKey(30) & 0xFF
+
+        # Quit without saving on Esc or q
+        if key in (27, ord('q')):
+            break
+
+        if key == ord('s'):
+            if len(calibration.area) < 3:
+                print("The area needs at least 3 points")
+                continue
+            line = tuple(calibration.line) if len(calibration.line) == 2 else None
+            save_camera(args.name, stream_path, calibration.area, line, args.config)
+            print(f"Saved camera {args.name} to {args.config}: area {calibration.area}, line {line}")
+            break
+
+        calibration.key(key)
+
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,190 +1,335 @@
 import os
+import json
 import time
-from openpyxl import Workbook
+import itertools
+import threading
 from datetime import datetime
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+from metrics import SHEETS_ERRORS
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 SPREADSHEET_ID = "1nnY6VrGRVhLlsm9XrcfwP79IltYj7JzynMJ1gbXSgWU"
-credentials = None
 
-# Check if token.json exists to retrieve credentials
-if os.path.exists("token.json"):
-    credentials = Credentials.from_authorized_user_file("token.json", SCOPES)
+# Base URL of the Sheets API, which can point to a local fake Sheets endpoint for testing
+SHEETS_ENDPOINT = os.environ.get("SMARTVIEW_SHEETS_ENDPOINT")
 
-# If credentials do not exist or are not valid, perform authentication
-if not credentials or not credentials.valid:
-    if credentials and credentials.expired and credentials.refresh_token:
-        credentials.refresh(Request())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-        credentials = flow.run_local_server(port=0)
+# File that keeps queued Sheets writes while the network is down
+QUEUE_PATH = "sheets_queue.jsonl"
 
-    # Save updated credentials to token.json
-    with open("token.json", "w") as token:
-        token.write(credentials.to_json())
+# Files holding the OAuth client secrets and the authorized user token
+CREDENTIALS_PATH = "credentials.json"
+TOKEN_PATH = "token.json"
 
+# The Google client libraries and credentials are only loaded by the writer thread when the first report is
+# sent, so importing this module never waits for the network or for an interactive sign-in
+credentials = None
+service = None
+service_lock = threading.Lock()
+writer = None
+writer_lock = threading.Lock()
 
-def google_sheet_raw_data(cell1, cell2, cell3, compliant, non_compliant):
+
+def authorize():
     """
-    Update Google Sheets with raw data.
+    Sign in interactively through the browser and save the authorized user token to token.json.
 
-    Args:
-        cell1 (str): The cell address for current date.
-        cell2 (str): The cell address for compliant data.
-        cell3 (str): The cell address for non-compliant data.
-        compliant (str): Compliant data to be updated.
-        non_compliant (str): Non-compliant data to be updated.
+    This is only needed once, or after the saved token has been revoked.
+    """
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+    authorized = flow.run_local_server(port=0)
+
+    # Save credentials to token.json
+    with open(TOKEN_PATH, "w") as token:
+        token.write(authorized.to_json())
+    print(f"Credentials saved to {TOKEN_PATH}.")
+
+
+def get_credentials():
     """
-    try:
-        service = build("sheets", "v4", credentials=credentials)
-        sheets = service.spreadsheets()
+    Return valid credentials, loading them from token.json and refreshing them when they have expired.
 
-        current_date = datetime.now().strftime("%B %d, %Y")
-        data1 = [[current_date]]
-        data2 = [[compliant]]
-        data3 = [[non_compliant]]
+    Called with service_lock held.
 
-        body1 = {"values": data1}
-        body2 = {"values": data2}
-        body3 = {"values": data3}
+    Returns:
+        credentials (google.oauth2.credentials.Credentials): Valid credentials.
 
-        # Update Google Sheets with raw data
-        result1 = sheets.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=cell1,
-            body=body1,
-            valueInputOption="RAW"
-        ).execute()
+    Raises:
+        RuntimeError: If no usable token has been saved. Reports then stay queued until one is.
+    """
+    global credentials
+
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
 
-        result2 = sheets.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=cell2,
-            body=body2,
-            valueInputOption="RAW"
-        ).execute()
+    # Check if token.json exists to retrieve credentials, it may have been created since the last attempt
+    if credentials is None and os.path.exists(TOKEN_PATH):
+        credentials = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
 
-        result3 = sheets.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=cell3,
-            body=body3,
-            valueInputOption="RAW"
-        ).execute()
+    if credentials is None:
+        raise RuntimeError(f"No Google credentials in {TOKEN_PATH}, run `python excel.py` to sign in")
 
-        print(f"{result1.get('updatedCells')} cells updated with the current date: {data1}.")
-        print(f"{result2.get('updatedCells')} cells updated with the value {data2}.")
-        print(f"{result3.get('updatedCells')} cells updated with the value {data3}.")
+    # Refresh expired credentials and save the updated token to token.json
+    if not credentials.valid:
+        if not (credentials.expired and credentials.refresh_token):
+            credentials = None
+            raise RuntimeError(f"Google credentials in {TOKEN_PATH} cannot be refreshed, run `python excel.py`")
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+        credentials.refresh(Request())
+        with open(TOKEN_PATH, "w") as token:
+            token.write(credentials.to_json())
 
+    return credentials
 
-def google_sheet_total_data():
+
+def get_sheets():
     """
-    Update Google Sheets with total data.
+    Return the spreadsheets resource of the single long-lived Sheets client, building it on first use.
+
+    Returns:
+        sheets: The spreadsheets resource of the Sheets client.
     """
-    try:
-        service = build("sheets", "v4", credentials=credentials)
-        sheets = service.spreadsheets()
+    global service
 
-        # Retrieve data from specified ranges
-        result = sheets.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=['C4:C16', 'D4:D16']).execute()
-        values = result.get('valueRanges', [])
+    with service_lock:
+        # Refresh the credentials before building a request rather than in the middle of one
+        authorized = get_credentials()
 
-        if len(values) == 2 and 'values' in values[0] and 'values' in values[1]:
-            data1_sum = sum(float(val[0]) for val in values[0]['values'] if val)
-            data2_sum = sum(float(val[0]) for val in values[1]['values'] if val)
-        else:
-            print("Unable to retrieve values from specified ranges.")
-            return
+        if service is None:
+            from googleapiclient.discovery import build
 
-        range1 = 'C17'
-        range2 = 'D17'
-        data1 = [[data1_sum]]
-        data2 = [[data2_sum]]
+            client_options = {"api_endpoint": SHEETS_ENDPOINT} if SHEETS_ENDPOINT else None
+            service = build("sheets", "v4", credentials=authorized, client_options=client_options)
 
-        body1 = {"values": data1}
-        body2 = {"values": data2}
+    return service.spreadsheets()
 
-        # Update Google Sheets with total data
-        result1 = sheets.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=range1,
-            body=body1,
-            valueInputOption="RAW"
-        ).execute()
 
-        result2 = sheets.values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=range2,
-            body=body2,
-            valueInputOption="RAW"
-        ).execute()
+def execute(request):
+    """
+    Execute a Sheets request, one at a time as the underlying HTTP connection is not thread-safe.
 
-        print(f"{result1.get('updatedCells')} cells updated with the sum of values from C4:C16: {data1_sum}.")
-        print(f"{result2.get('updatedCells')} cells updated with the sum of values from D4:D16: {data2_sum}.")
+    Args:
+        request: Request built from the spreadsheets resource.
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+    Returns:
+        result (dict): Response of the Sheets API.
+    """
+    with service_lock:
+        return request.execute()
 
 
-def download_google_sheet_and_save():
+class Sheets_Writer(threading.Thread):
     """
-    Download Google Sheets and save as Excel file.
+    Thread that sends all Sheets writes through one worker, merging queued writes into batch requests.
+
+    Queued writes are saved to a local file until they have been sent, so writes made while the network is
+    down survive a restart. Failed requests are retried with exponential backoff, except those the API rejects
+    as invalid, which drop only their own writes.
+
+    Attributes:
+        queue_path (str): Path of the file that keeps the queued writes.
+        pending (list): Queued write operations, each an 'update' or 'clear' dictionary.
+        max_backoff (float): Maximum number of seconds between retries.
     """
-    try:
-        service = build("sheets", "v4", credentials=credentials)
-        sheets = service.spreadsheets()
 
-        # Retrieve data from Google Sheets
-        result = sheets.values().get(spreadsheetId=SPREADSHEET_ID, range="A1:Z").execute()
-        values = result.get('values', [])
+    def __init__(self, queue_path=QUEUE_PATH, max_backoff=300.0):
+        """
+        Initialize Sheets_Writer and load the writes left over from an earlier run.
+
+        Args:
+            queue_path (str): Path of the file that keeps the queued writes.
+            max_backoff (float): Maximum number of seconds between retries.
+        """
+        super().__init__(name="sheets writer", daemon=True)
+        self.queue_path = queue_path
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.pending = []
+
+        if os.path.exists(queue_path):
+            with open(queue_path, "r") as queue_file:
+                self.pending = [json.loads(line) for line in queue_file if line.strip()]
+            if self.pending:
+                print(f"Loaded {len(self.pending)} queued Sheets writes from {queue_path}.")
+
+    def save(self):
+        """
+        Save the queued writes to the queue file, replacing it in one step.
+        """
+        temporary_path = f"{self.queue_path}.tmp"
+        with open(temporary_path, "w") as queue_file:
+            for operation in self.pending:
+                queue_file.write(json.dumps(operation) + "\n")
+        os.replace(temporary_path, self.queue_path)
+
+    def enqueue(self, operations):
+        """
+        Queue write operations to be sent by the worker.
+
+        Args:
+            operations (list): List of {'type': 'update', 'range': ..., 'values': ...} or
+                {'type': 'clear', 'range': ...} dictionaries.
+        """
+        with self.condition:
+            self.pending.extend(operations)
+            self.save()
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait until all queued writes have been sent.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            bool: True if all writes were sent, False if the wait timed out.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+    def send(self, kind, operations):
+        """
+        Send consecutive write operations of one kind, updates in one batchUpdate and clears in one batchClear
+        request.
+
+        Args:
+            kind (str): 'update' or 'clear'.
+            operations (list): List of write operations of that kind in the order they were queued.
+        """
+        sheets = get_sheets()
+
+        if kind == "update":
+            # Later writes to the same range replace earlier ones
+            data = {}
+            for operation in operations:
+                data.pop(operation["range"], None)
+                data[operation["range"]] = operation["values"]
+
+            body = {"valueInputOption": "RAW",
+                    "data": [{"range": range_, "values": values} for range_, values in data.items()]}
+            result = execute(sheets.values().batchUpdate(spreadsheetId=SPREADSHEET_ID, body=body))
+            print(f"{result.get('totalUpdatedCells')} cells updated in {len(data)} ranges.")
+        else:
+            ranges = list(dict.fromkeys(operation["range"] for operation in operations))
+            execute(sheets.values().batchClear(spreadsheetId=SPREADSHEET_ID, body={"ranges": ranges}))
+            print(f"Data cleared from ranges: {', '.join(ranges)}")
+
+    def run(self):
+        """
+        Send queued writes as they arrive, one batch request per run of writes of the same kind, retrying with
+        exponential backoff while the requests fail.
+        """
+        from googleapiclient.errors import HttpError
+
+        backoff = 1.0
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                kind = self.pending[0]["type"]
+                operations = list(itertools.takewhile(lambda operation: operation["type"] == kind, self.pending))
+
+            try:
+                self.send(kind, operations)
+            except HttpError as error:
+                # A request the API rejects as invalid will never succeed, so only its own writes are dropped.
+                # Rate limits, server errors and missing or revoked permissions are retried
+                if error.resp.status == 400:
+                    SHEETS_ERRORS.labels(action="dropped").inc()
+                    print(f"An error occurred: {error}. Dropping {len(operations)} queued writes.")
+                else:
+                    SHEETS_ERRORS.labels(action="retry").inc()
+                    print(f"An error occurred: {error}. Retrying in {backoff:.0f} s.")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+            except Exception as error:
+                # The network or the credentials are unavailable, keep the writes queued on disk
+                SHEETS_ERRORS.labels(action="retry").inc()
+                print(f"An error occurred: {error}. Retrying in {backoff:.0f} s.")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            with self.condition:
+                del self.pending[:len(operations)]
+                self.save()
+                self.condition.notify_all()
+
+
+def get_writer():
+    """
+    Return the single Sheets_Writer, starting it on first use.
 
-        if not values:
-            print('No data found.')
-            return
+    Returns:
+        writer (Sheets_Writer): The Sheets writer.
+    """
+    global writer
 
-        # Create Excel workbook and worksheet
-        wb = Workbook()
-        ws = wb.active
+    with writer_lock:
+        if writer is None:
+            writer = Sheets_Writer()
+            writer.start()
 
-        # Populate Excel worksheet with retrieved data
-        for row in values:
-            ws.append(row)
+    return writer
 
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        file_name = f"SMARTVIEW-{current_date}.xlsx"
 
-        # Save Excel workbook
-        wb.save(file_name)
-        print(f'Sheet downloaded and saved successfully as "{file_name}".')
+def google_sheet_raw_data(cell1, cell2, cell3, compliant, non_compliant):
+    """
+    Update Google Sheets with raw data.
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+    Args:
+        cell1 (str): The cell address for current date.
+        cell2 (str): The cell address for compliant data.
+        cell3 (str): The cell address for non-compliant data.
+        compliant (str): Compliant data to be updated.
+        non_compliant (str): Non-compliant data to be updated.
+    """
+    current_date = datetime.now().strftime("%B %d, %Y")
+
+    # Queue the updates, they are sent together in one batchUpdate request
+    get_writer().enqueue([
+        {"type": "update", "range": cell1, "values": [[current_date]]},
+        {"type": "update", "range": cell2, "values": [[compliant]]},
+        {"type": "update", "range": cell3, "values": [[non_compliant]]},
+    ])
+    print(f"Queued the current date {current_date} and the values {compliant} and {non_compliant}.")
+
+
+def google_sheet_total_data(compliant, non_compliant):
+    """
+    Update Google Sheets with total data.
+
+    The totals are calculated from the local count store, so nothing has to be read back from the sheet.
+
+    Args:
+        compliant (int): Total compliant count of the day.
+        non_compliant (int): Total non-compliant count of the day.
+    """
+    # Queue the totals, they are sent together in one batchUpdate request
+    get_writer().enqueue([
+        {"type": "update", "range": "C17", "values": [[compliant]]},
+        {"type": "update", "range": "D17", "values": [[non_compliant]]},
+    ])
+    print(f"Queued the totals {compliant} and {non_compliant}.")
 
 
 def clear_google_sheet_data():
     """
     Clear data from specified ranges in Google Sheets.
     """
-    try:
-        service = build("sheets", "v4", credentials=credentials)
-        sheets = service.spreadsheets()
+    ranges_to_clear = [
+        'C1',
+        'C4:C17',
+        'D4:D17'
+    ]
 
-        ranges_to_clear = [
-            'C1',
-            'C4:C17',
-            'D4:D17'
-        ]
+    # Queue the clears, they are sent together in one batchClear request
+    get_writer().enqueue([{"type": "clear", "range": range_} for range_ in ranges_to_clear])
 
-        # Clear data from specified ranges
-        for range_ in ranges_to_clear:
-            sheets.values().clear(spreadsheetId=SPREADSHEET_ID, range=range_).execute()
-            print(f"Data cleared from range: {range_}")
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+if __name__ == "__main__":
+    # Sign in once to create token.json, the reports then load it when they are first sent
+    authorize()
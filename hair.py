@@ -0,0 +1,187 @@
+import numpy as np
+from detections import *
+
+# Part of a person box taken as the head region, as left, top, right and bottom fractions of the box
+HEAD_REGION = (0.2, 0.0, 0.8, 0.25)
+
+# Compliance category of people whose hair is not a standard colour
+NONCOMPLIANT = CATEGORIES.index('bsunoncomply')
+
+
+def load_hair_model(path='hair-cls.pt'):
+    """
+    Load the hair colour classification model.
+
+    Args:
+        path (str): Path to the weights of a YOLOv8 classification model, whose class names contain "non" for
+            hair colours that are not standard, such as "standard" and "nonstandard".
+
+    Returns:
+        model: The hair colour classification model.
+    """
+    from ultralytics import YOLO
+
+    return YOLO(path, task='classify')
+
+
+def head_crops(frame, boxes, region=HEAD_REGION, min_size=8):
+    """
+    Cut the head region of person boxes from a frame.
+
+    Args:
+        frame (numpy.ndarray): Frame the boxes are on.
+        boxes (numpy.ndarray): Integer array of shape (N, 4) or more with [x1, y1, x2, y2, ...] rows.
+        region (tuple): Head region as left, top, right and bottom fractions of a box.
+        min_size (int): Minimum width and height in pixels of a usable crop.
+
+    Returns:
+        crops (list): Head crop of every box, or None where the crop is too small to classify.
+    """
+    height, width = frame.shape[:2]
+    left, top, right, bottom = region
+    crops = []
+
+    for x1, y1, x2, y2 in boxes[:, :4].tolist():
+        box_width, box_height = x2 - x1, y2 - y1
+        hx1 = min(max(int(x1 + left * box_width), 0), width)
+        hy1 = min(max(int(y1 + top * box_height), 0), height)
+        hx2 = min(max(int(x1 + right * box_width), 0), width)
+        hy2 = min(max(int(y1 + bottom * box_height), 0), height)
+
+        if hx2 - hx1 < min_size or hy2 - hy1 < min_size:
+            crops.append(None)
+        else:
+            crops.append(frame[hy1:hy2, hx1:hx2])
+
+    return crops
+
+
+class Hair_Classifier:
+    """
+    Class for the second-stage hair colour classifier shared by all cameras.
+
+    Attributes:
+        model: The hair colour classification model.
+        imgsz (int): Input resolution of the classifier.
+        table (numpy.ndarray): Whether every class ID of the classifier is a non-standard hair colour, built
+            from the class names on the first call.
+    """
+
+    def __init__(self, model, imgsz=96):
+        """
+        Initialize Hair_Classifier.
+
+        Args:
+            model: The hair colour classification model.
+            imgsz (int): Input resolution of the classifier, small as head crops are small.
+        """
+        self.model = model
+        self.imgsz = imgsz
+        self.table = None
+
+    def classify(self, crops):
+        """
+        Classify head crops in one forward pass.
+
+        Args:
+            crops (list): List of head crops.
+
+        Returns:
+            nonstandard (numpy.ndarray): Whether the hair in every crop is not a standard colour.
+        """
+        results = self.model.predict(crops, imgsz=self.imgsz, verbose=False)
+
+        if self.table is None:
+            names = results[0].names
+            self.table = np.zeros(max(names) + 1, bool)
+            for class_id, name in names.items():
+                self.table[class_id] = 'non' in name.lower()
+
+        top1 = np.array([int(result.probs.top1) for result in results], np.int64)
+        return self.table[top1]
+
+    def warm_up(self):
+        """
+        Classify a blank crop, so the first people checked do not wait for the lazy initialisation of the model.
+        """
+        self.classify([np.zeros((self.imgsz, self.imgsz, 3), np.uint8)])
+
+
+class Hair_Check:
+    """
+    Class for the hair colour check of the tracked people of one camera, with the results cached per track ID.
+
+    Every person is classified on at most `samples` detector frames, `interval` frames apart, and the majority
+    of those results is kept for the rest of the track, so the classifier only runs while new people arrive.
+    People with non-standard hair are counted as non-compliant whatever their uniform.
+
+    Attributes:
+        classifier (Hair_Classifier): Classifier shared by all cameras.
+        votes (dict): Dictionary mapping track IDs to their [standard, non-standard] votes.
+        last_classified (dict): Dictionary mapping track IDs to the frame they were last classified on.
+        last_seen (dict): Dictionary mapping track IDs to the frame they were last tracked on.
+    """
+
+    def __init__(self, classifier, samples=3, interval=5, max_age=30):
+        """
+        Initialize Hair_Check with no cached results.
+
+        Args:
+            classifier (Hair_Classifier): Classifier shared by all cameras.
+            samples (int): Number of times every person is classified.
+            interval (int): Minimum number of frames between two classifications of the same person.
+            max_age (int): Number of frames after which the results of a person no longer tracked are forgotten.
+        """
+        self.classifier = classifier
+        self.samples = samples
+        self.interval = interval
+        self.max_age = max_age
+        self.votes = {}
+        self.last_classified = {}
+        self.last_seen = {}
+
+    def update(self, frame, boxes, frame_number):
+        """
+        Classify the people due for a hair colour check and mark those with non-standard hair as non-compliant.
+
+        Args:
+            frame (numpy.ndarray): Frame the boxes were detected on, or None if the detector was not run.
+            boxes (numpy.ndarray): Integer array of shape (N, 6) with [x1, y1, x2, y2, obj_id, category] rows,
+                whose categories are changed in place.
+            frame_number (int): Number of the frame.
+
+        Returns:
+            boxes (numpy.ndarray): The boxes.
+        """
+        obj_ids = boxes[:, 4].tolist()
+        for obj_id in obj_ids:
+            self.last_seen[obj_id] = frame_number
+
+        # Classify the head crops of the people that still need votes, all in one call
+        if frame is not None:
+            due = [i for i, obj_id in enumerate(obj_ids)
+                   if sum(self.votes.get(obj_id, (0, 0))) < self.samples
+                   and frame_number - self.last_classified.get(obj_id, -self.interval) >= self.interval]
+            crops = head_crops(frame, boxes[due]) if due else []
+            usable = [(i, crop) for i, crop in zip(due, crops) if crop is not None]
+
+            if usable:
+                nonstandard = self.classifier.classify([crop for _, crop in usable])
+                for (i, _), vote in zip(usable, nonstandard.tolist()):
+                    votes = self.votes.setdefault(obj_ids[i], [0, 0])
+                    votes[int(vote)] += 1
+                    self.last_classified[obj_ids[i]] = frame_number
+
+        # Count people whose votes are mostly non-standard as non-compliant
+        for i, obj_id in enumerate(obj_ids):
+            votes = self.votes.get(obj_id)
+            if votes is not None and votes[1] > votes[0]:
+                boxes[i, 5] = NONCOMPLIANT
+
+        # Forget people that are no longer tracked
+        for obj_id in [obj_id for obj_id, seen in self.last_seen.items() if frame_number - seen > self.max_age]:
+            del self.last_seen[obj_id]
+            self.votes.pop(obj_id, None)
+            self.last_classified.pop(obj_id, None)
+
+        return boxes
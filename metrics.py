@@ -0,0 +1,450 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'Registry', 'Metrics_Server', 'REGISTRY', 'STAGE_SECONDS',
+           'DROPPED_FRAMES', 'SHEETS_ERRORS', 'COUNTED_OBJECTS', 'DECODE_LAG', 'RECONNECTS', 'Startup_Timer']
+
+# Upper bounds in seconds of the latency histogram buckets, from 0.5 ms to 2.5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Metric:
+    """
+    Base class for a metric family with a value per combination of label values. Subclasses create the values
+    in new_child and format them in render_child.
+
+    Attributes:
+        name (str): Name of the metric in the Prometheus text format.
+        help (str): Description of the metric.
+        label_names (tuple): Names of the labels of the metric.
+        children (dict): Dictionary mapping label value tuples to the value of each labelled metric.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, label_names=()):
+        """
+        Initialize Metric with no labelled values.
+
+        Args:
+            name (str): Name of the metric in the Prometheus text format.
+            help (str): Description of the metric.
+            label_names (tuple): Names of the labels of the metric.
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, **label_values):
+        """
+        Return the metric with the given label values, creating it on first use.
+
+        Args:
+            **label_values: Value of every label of the metric.
+
+        Returns:
+            child: The labelled metric.
+        """
+        key = tuple(str(label_values[label_name]) for label_name in self.label_names)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.new_child())
+        return child
+
+    def label_text(self, key, extra=()):
+        """
+        Format label values in the Prometheus text format.
+
+        Args:
+            key (tuple): Label values.
+            extra (tuple): Additional (name, value) label pairs.
+
+        Returns:
+            text (str): Labels in the format {name="value",...}, or an empty string without labels.
+        """
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self):
+        """
+        Format the metric in the Prometheus text format.
+
+        Returns:
+            lines (list): Lines of the metric.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.children.items()):
+            lines.extend(self.render_child(key, child))
+        return lines
+
+
+class Value:
+    """
+    Class for a single number that can be changed from several threads.
+
+    Attributes:
+        value (float): Current value.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """
+        Increase the value.
+
+        Args:
+            amount (float): Amount to add.
+        """
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        """
+        Set the value.
+
+        Args:
+            value (float): New value.
+        """
+        self.value = float(value)
+
+
+class Counter(Metric):
+    """
+    Metric counting events, such as dropped frames, that only ever increases.
+    """
+
+    kind = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def render_child(self, key, child):
+        return [f"{self.name}{self.label_text(key)} {child.value:g}"]
+
+
+class Gauge(Metric):
+    """
+    Metric holding a current value, such as the number of objects counted, that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def new_child(self):
+        return Value()
+
+    def render_child(self, key, child):
+        return [f"{self.name}{self.label_text(key)} {child.value:g}"]
+
+
+class Histogram_Value:
+    """
+    Class for the bucket counts of observed durations.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets in seconds.
+        counts (list): Number of observations per bucket, with one more bucket for larger durations.
+        sum (float): Sum of all observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Record a duration.
+
+        Args:
+            seconds (float): Observed duration in seconds.
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def add(self, counts, seconds):
+        """
+        Add bucket counts observed elsewhere, such as in another process.
+
+        Args:
+            counts (list): Number of observations per bucket.
+            seconds (float): Sum of the observations.
+        """
+        with self.lock:
+            self.counts = [count + added for count, added in zip(self.counts, counts)]
+            self.sum += seconds
+
+    @contextmanager
+    def time(self):
+        """
+        Context manager recording the duration of its block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Return a copy of the bucket counts and the sum.
+
+        Returns:
+            snapshot (tuple): List of bucket counts and the sum of the observations.
+        """
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+def quantile(buckets, counts, q):
+    """
+    Estimate a quantile from histogram bucket counts by interpolating within the bucket it falls in.
+
+    Args:
+        buckets (tuple): Upper bounds of the buckets.
+        counts (list): Number of observations per bucket, with one more bucket for larger values.
+        q (float): Quantile between 0 and 1.
+
+    Returns:
+        value (float): Estimated quantile, or None without observations.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = buckets[index - 1] if index > 0 else 0.0
+            if index == len(buckets):
+                return lower
+            return lower + (buckets[index] - lower) * (rank - seen) / count
+        seen += count
+
+    return buckets[-1]
+
+
+class Histogram(Metric):
+    """
+    Metric counting durations, such as the latency of a pipeline stage, in buckets.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets in seconds.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize Histogram.
+
+        Args:
+            name (str): Name of the metric in the Prometheus text format.
+            help (str): Description of the metric.
+            label_names (tuple): Names of the labels of the metric.
+            buckets (tuple): Upper bounds of the buckets in seconds.
+        """
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+
+    def new_child(self):
+        return Histogram_Value(self.buckets)
+
+    def render_child(self, key, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{self.name}_bucket{self.label_text(key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self.label_text(key)} {total:g}")
+        lines.append(f"{self.name}_count{self.label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Class collecting the metrics exposed on the metrics endpoint and in the periodic log line.
+
+    Attributes:
+        metrics (list): List of registered Metric objects.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.previous = {}
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric (Metric): Metric to add.
+
+        Returns:
+            metric (Metric): The added metric.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Format all metrics in the Prometheus text format.
+
+        Returns:
+            text (str): Metrics text.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def log_line(self):
+        """
+        Build a one-line summary of the metrics since the last call.
+
+        Histograms are summarized by the count and the estimated p50 and p99 in milliseconds of the durations
+        observed since the last call, counters and gauges by their current value.
+
+        Returns:
+            line (str): Summary in the format "predict n=40 p50=80.1 p99=120.5 ms | dropped_frames{...}=0 | ...".
+        """
+        parts = []
+        for metric in self.metrics:
+            for key, child in sorted(metric.children.items()):
+                label = ",".join(key)
+                if isinstance(metric, Histogram):
+                    counts, _ = child.snapshot()
+                    previous = self.previous.get((metric.name, key), [0] * len(counts))
+                    self.previous[(metric.name, key)] = counts
+                    window = [count - before for count, before in zip(counts, previous)]
+                    if sum(window):
+                        p50 = quantile(metric.buckets, window, 0.5) * 1000
+                        p99 = quantile(metric.buckets, window, 0.99) * 1000
+                        parts.append(f"{label} n={sum(window)} p50={p50:.1f} p99={p99:.1f} ms")
+                elif child.value:
+                    name = metric.name.replace("smartview_", "")
+                    parts.append(f"{name}{{{label}}}={child.value:g}")
+
+        return " | ".join(parts)
+
+
+class Metrics_Server(threading.Thread):
+    """
+    Thread serving the metrics of a registry in the Prometheus text format on a local HTTP endpoint.
+
+    Attributes:
+        server (ThreadingHTTPServer): HTTP server answering GET /metrics.
+    """
+
+    def __init__(self, registry, port=9108, host="127.0.0.1"):
+        """
+        Initialize Metrics_Server and bind its port.
+
+        Args:
+            registry (Registry): Registry of the metrics served.
+            port (int): Port of the endpoint.
+            host (str): Address the endpoint listens on, local only by default.
+        """
+        super().__init__(name="metrics", daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are too frequent to print
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def run(self):
+        """
+        Serve requests until the server is stopped.
+        """
+        self.server.serve_forever()
+
+    def stop(self):
+        """
+        Stop serving and close the port.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Startup_Timer:
+    """
+    Class timing the startup phases of the process, from the imports to the first counted frame.
+
+    Attributes:
+        start (float): time.perf_counter() when the timer was created.
+        last (float): time.perf_counter() when the last phase ended.
+        phases (list): List of (phase, seconds) tuples in the order the phases ended.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        """
+        Record that a phase ended now, having started when the previous one ended.
+
+        Args:
+            phase (str): Name of the phase.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        """
+        Build a one-line summary of the startup phases.
+
+        Returns:
+            line (str): Summary in the format "Startup: imports 0.70 s | model 2.10 s | ... | total 4.02 s".
+        """
+        parts = [f"{phase} {seconds:.2f} s" for phase, seconds in self.phases]
+        parts.append(f"total {self.last - self.start:.2f} s")
+        return "Startup: " + " | ".join(parts)
+
+
+# Metrics of the SMARTVIEW pipeline
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "smartview_stage_seconds", "Time spent per frame or batch in each pipeline stage.", ["stage"]))
+DROPPED_FRAMES = REGISTRY.register(Counter(
+    "smartview_dropped_frames_total", "Frames discarded because a later stage was busy.", ["queue"]))
+SHEETS_ERRORS = REGISTRY.register(Counter(
+    "smartview_sheets_errors_total", "Failed Google Sheets requests.", ["action"]))
+COUNTED_OBJECTS = REGISTRY.register(Gauge(
+    "smartview_counted_objects", "Objects counted in the current reporting interval.", ["camera", "category"]))
+DECODE_LAG = REGISTRY.register(Gauge(
+    "smartview_decode_lag_seconds", "How far the decoded frames lag behind the live stream.", ["stream"]))
+RECONNECTS = REGISTRY.register(Counter(
+    "smartview_reconnects_total", "Times a failed live stream was reopened.", ["stream"]))
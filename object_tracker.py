@@ -1,63 +1,326 @@
-import math
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def hungarian_solver():
+    """
+    Import the Hungarian algorithm of SciPy on first use, as importing SciPy takes longer than all other imports
+    of the pipeline together.
+
+    Returns:
+        linear_sum_assignment: The SciPy solver, or None if SciPy is not installed.
+    """
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        # SciPy is optional, assign_nearest falls back to a greedy nearest-first matching without it
+        return None
+
+    return linear_sum_assignment
+
+
+def assign_nearest(distances, max_distance):
+    """
+    Match rows to columns of a distance matrix so that the total distance is minimal.
+
+    Uses the Hungarian algorithm when SciPy is available and a greedy nearest-first matching otherwise.
+    Pairs whose distance is not below max_distance are never matched.
+
+    Args:
+        distances (numpy.ndarray): Matrix of shape (N, M) with the distance between every row and column.
+        max_distance (float): Distance below which a row and a column may be matched.
+
+    Returns:
+        rows (numpy.ndarray): Row indices of the matched pairs.
+        cols (numpy.ndarray): Column indices of the matched pairs.
+    """
+    linear_sum_assignment = hungarian_solver()
+    if linear_sum_assignment is not None:
+        # Give pairs that are too far apart a cost that the optimal assignment never prefers
+        cost = np.where(distances < max_distance, distances, max_distance * (distances.size + 1))
+        rows, cols = linear_sum_assignment(cost)
+        keep = distances[rows, cols] < max_distance
+        return rows[keep], cols[keep]
+
+    # Greedy fallback: visit candidate pairs from nearest to farthest
+    rows, cols = np.nonzero(distances < max_distance)
+    order = np.argsort(distances[rows, cols], kind='stable')
+    used_rows = set()
+    used_cols = set()
+    matched_rows = []
+    matched_cols = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            matched_rows.append(row)
+            matched_cols.append(col)
+
+    return np.array(matched_rows, np.int64), np.array(matched_cols, np.int64)
 
 
 class Object_Tracker:
     """
     Class for tracking objects based on their bounding boxes.
 
+    The tracked objects are kept in NumPy arrays, so the distances between all new and tracked center points
+    are computed in one step and every new box is matched to the closest tracked object.
+
+    When class IDs are passed to update, objects of all classes are tracked together and the class of every
+    object is decided by a majority vote over all frames it was seen in, so a flickering label does not
+    start a new track. Objects that are not detected stay tracked for up to max_missed frames, so a brief
+    occlusion does not give them a new ID.
+
+    Every tracked object also keeps its velocity, so its position can be predicted for frames that are not
+    run through the detector, and it is matched at its predicted position when it is detected again.
+
     Attributes:
-        center_points (dict): Dictionary containing object IDs as keys and their corresponding center points as values.
+        ids (numpy.ndarray): IDs of the tracked objects.
+        centers (numpy.ndarray): Center points of the tracked objects, one [cx, cy] row per ID.
+        rects (numpy.ndarray): Last detected bounding box of the tracked objects, one [x, y, w, h] row per ID.
+        velocities (numpy.ndarray): Velocity of the tracked objects in pixels per frame, one [vx, vy] row per ID.
+        elapsed (numpy.ndarray): Number of frames since each tracked object was last detected.
+        votes (numpy.ndarray): Number of frames each tracked object was detected as each class.
+        missed (numpy.ndarray): Number of consecutive frames each tracked object has not been detected.
         id_count (int): Counter for assigning unique IDs to objects.
+        max_distance (float): Distance in pixels below which a box is matched to a tracked object.
+        max_missed (int): Number of consecutive frames an undetected object is kept before it is dropped.
     """
 
-    def __init__(self):
+    def __init__(self, max_distance=35, num_classes=1, max_missed=10):
         """
-        Initialize Object_Tracker with an empty dictionary for center points and ID count set to 0.
+        Initialize Object_Tracker with no tracked objects and ID count set to 0.
+
+        Args:
+            max_distance (float): Distance in pixels below which a box is matched to a tracked object.
+            num_classes (int): Number of classes voted on when class IDs are passed to update.
+            max_missed (int): Number of consecutive frames an undetected object is kept before it is dropped.
         """
-        self.center_points = {}
+        self.ids = np.empty(0, np.int64)
+        self.centers = np.empty((0, 2), np.int64)
+        self.rects = np.empty((0, 4), np.int64)
+        self.velocities = np.empty((0, 2), np.float64)
+        self.elapsed = np.empty(0, np.int64)
+        self.votes = np.empty((0, num_classes), np.int64)
+        self.missed = np.empty(0, np.int64)
         self.id_count = 0
+        self.max_distance = max_distance
+        self.num_classes = num_classes
+        self.max_missed = max_missed
+
+    @property
+    def center_points(self):
+        """
+        dict: Dictionary containing object IDs as keys and their corresponding center points as values.
+        """
+        return {obj_id: tuple(center) for obj_id, center in zip(self.ids.tolist(), self.centers.tolist())}
 
-    def update(self, objects_rect):
+    def update(self, objects_rect, class_ids=None):
         """
         Update the object tracker based on the provided bounding box coordinates.
 
         Args:
             objects_rect (list): List of bounding box coordinates in the format [x, y, w, h].
+            class_ids (list): Class ID detected for every bounding box, or None to track without classes.
+
+        Returns:
+            objects_bbs_ids (list): List of bounding box coordinates with assigned object IDs, followed by the
+                majority-vote class ID of the object when class_ids is given.
+        """
+        rects = np.asarray(objects_rect, np.int64).reshape(-1, 4)
+        centers = np.column_stack(((2 * rects[:, 0] + rects[:, 2]) // 2, (2 * rects[:, 1] + rects[:, 3]) // 2))
+
+        ids = np.empty(len(rects), np.int64)
+        votes = np.zeros((len(rects), self.num_classes), np.int64)
+        velocities = np.zeros((len(rects), 2), np.float64)
+        matched = np.zeros(len(rects), bool)
+        unmatched = np.ones(len(self.ids), bool)
+        self.elapsed += 1
+
+        if len(rects) and len(self.ids):
+            # Calculate distances between every new center point and every predicted center point at once
+            predicted = self.centers + self.velocities * self.elapsed[:, None]
+            distances = np.hypot(centers[:, None, 0] - predicted[None, :, 0],
+                                 centers[:, None, 1] - predicted[None, :, 1])
+
+            # Assign the IDs of the closest tracked objects within the threshold
+            rows, cols = assign_nearest(distances, self.max_distance)
+            ids[rows] = self.ids[cols]
+            votes[rows] = self.votes[cols]
+            matched[rows] = True
+            unmatched[cols] = False
+
+            # Smooth the velocity measured over the frames since each object was last detected
+            measured = (centers[rows] - self.centers[cols]) / self.elapsed[cols, None]
+            velocities[rows] = 0.5 * self.velocities[cols] + 0.5 * measured
+
+        # If no existing object matches, assign a new object ID
+        new = ~matched
+        new_count = int(new.sum())
+        ids[new] = np.arange(self.id_count, self.id_count + new_count)
+        self.id_count += new_count
+
+        if class_ids is not None:
+            # Add this frame's class votes
+            votes[np.arange(len(rects)), np.asarray(class_ids, np.int64)] += 1
+
+        # Keep undetected objects at their last position until they have been missed too often
+        missed = self.missed[unmatched] + 1
+        lost = np.flatnonzero(unmatched)[missed <= self.max_missed]
+
+        self.ids = np.concatenate((ids, self.ids[lost]))
+        self.centers = np.concatenate((centers, self.centers[lost]))
+        self.rects = np.concatenate((rects, self.rects[lost]))
+        self.velocities = np.concatenate((velocities, self.velocities[lost]))
+        self.elapsed = np.concatenate((np.zeros(len(rects), np.int64), self.elapsed[lost]))
+        self.votes = np.concatenate((votes, self.votes[lost]))
+        self.missed = np.concatenate((np.zeros(len(rects), np.int64), missed[missed <= self.max_missed]))
+
+        if class_ids is None:
+            return np.column_stack((rects, ids)).tolist()
+
+        # Pick the class each object was detected as most often
+        classes = votes.argmax(axis=1)
+
+        return np.column_stack((rects, ids, classes)).tolist()
+
+    def predict(self, with_classes=False):
+        """
+        Advance the tracker by a frame that was not run through the detector.
+
+        The objects detected in the latest update are moved along their velocity, while objects that were
+        missed stay lost, and no track is started or dropped.
+
+        Args:
+            with_classes (bool): Whether to add the majority-vote class ID of every object, as update does when
+                class IDs are given.
+
+        Returns:
+            objects_bbs_ids (list): List of predicted bounding box coordinates with their object IDs, in the same
+                format as returned by update.
+        """
+        self.elapsed += 1
+        visible = self.missed == 0
+
+        # Move the boxes by the distance travelled since the objects were last detected
+        rects = self.rects[visible].copy()
+        rects[:, :2] += np.rint(self.velocities[visible] * self.elapsed[visible, None]).astype(np.int64)
+
+        if not with_classes:
+            return np.column_stack((rects, self.ids[visible])).tolist()
+
+        return np.column_stack((rects, self.ids[visible], self.votes[visible].argmax(axis=1))).tolist()
+
+
+class Counted_Ids:
+    """
+    Class for remembering which object IDs have been counted and how many objects were counted per class.
+
+    Entries are kept in order of when they were last seen, so those not seen for max_age seconds can be
+    evicted from the front in constant time per entry. Evicting an entry does not change the counts, so
+    memory stays bounded however long the counting interval is.
+
+    The changes of the counts since they were last stored are kept separately from the counts, so the
+    counts can be reset for a new reporting interval without losing what still has to be stored.
+
+    The counts may be taken from another thread, so callers updating the entries hold the lock.
+
+    Attributes:
+        entries (OrderedDict): Dictionary mapping counted object IDs to their [class_id, last_seen] entry.
+        counts (numpy.ndarray): Number of counted objects per class.
+        changes (numpy.ndarray): Change of the number of counted objects per class since take_changes.
+        max_age (float): Number of seconds after which an unseen object ID is forgotten.
+        lock (threading.Lock): Lock held while the entries and counts are updated.
+    """
+
+    def __init__(self, num_classes, max_age=60.0):
+        """
+        Initialize Counted_Ids with no counted objects.
+
+        Args:
+            num_classes (int): Number of classes to count.
+            max_age (float): Number of seconds after which an unseen object ID is forgotten.
+        """
+        self.entries = OrderedDict()
+        self.counts = np.zeros(num_classes, np.int64)
+        self.changes = np.zeros(num_classes, np.int64)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+    def __contains__(self, obj_id):
+        return obj_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, obj_id, class_id, now):
+        """
+        Count an object the first time it is seen and follow changes of its majority-vote class afterwards.
+
+        Args:
+            obj_id (int): ID of the object.
+            class_id (int): Current class of the object.
+            now (float): Current time in seconds.
+        """
+        entry = self.entries.get(obj_id)
+
+        if entry is None:
+            self.entries[obj_id] = [class_id, now]
+            self.counts[class_id] += 1
+            self.changes[class_id] += 1
+            return
+
+        # Move the object to its new class if the vote has changed
+        if entry[0] != class_id:
+            self.counts[entry[0]] -= 1
+            self.counts[class_id] += 1
+            self.changes[entry[0]] -= 1
+            self.changes[class_id] += 1
+            entry[0] = class_id
+
+        entry[1] = now
+        self.entries.move_to_end(obj_id)
+
+    def evict(self, now):
+        """
+        Forget the object IDs that have not been seen for more than max_age seconds.
+
+        Args:
+            now (float): Current time in seconds.
+        """
+        while self.entries:
+            obj_id, (_, last_seen) = next(iter(self.entries.items()))
+            if now - last_seen <= self.max_age:
+                break
+            self.entries.popitem(last=False)
+
+    def take(self):
+        """
+        Return the counts and start counting again from zero, in one step.
 
         Returns:
-            objects_bbs_ids (list): List of bounding box coordinates with assigned object IDs.
-        """
-        objects_bbs_ids = []
-
-        for rect in objects_rect:
-            x, y, w, h = rect
-            cx = (x + x + w) // 2
-            cy = (y + y + h) // 2
-
-            object_detected = False
-            for obj_id, pt in self.center_points.items():
-                # Calculate distance between the current center point and previously tracked center points
-                dist = math.hypot(cx - pt[0], cy - pt[1])
-
-                # If the distance is within a threshold, update the center point and assign the object ID
-                if dist < 35:
-                    self.center_points[obj_id] = (cx, cy)
-                    objects_bbs_ids.append([x, y, w, h, obj_id])
-                    object_detected = True
-                    break
-
-            # If no existing object matches, assign a new object ID
-            if not object_detected:
-                self.center_points[self.id_count] = (cx, cy)
-                objects_bbs_ids.append([x, y, w, h, self.id_count])
-                self.id_count += 1
-
-        # Update the center_points dictionary with the latest positions of tracked objects
-        new_center_points = {}
-        for obj_bb_id in objects_bbs_ids:
-            _, _, _, _, object_id = obj_bb_id
-            center = self.center_points[object_id]
-            new_center_points[object_id] = center
-
-        self.center_points = new_center_points.copy()
-        return objects_bbs_ids
+            counts (numpy.ndarray): Number of counted objects per class before the reset.
+        """
+        with self.lock:
+            counts = self.counts.copy()
+            self.entries.clear()
+            self.counts[:] = 0
+
+        return counts
+
+    def take_changes(self):
+        """
+        Return the changes of the counts since the last call and start collecting changes again from zero.
+
+        Returns:
+            changes (numpy.ndarray): Change of the number of counted objects per class.
+        """
+        with self.lock:
+            changes = self.changes.copy()
+            self.changes[:] = 0
+
+        return changes
@@ -0,0 +1,652 @@
+import os
+import cv2
+import math
+import time
+import queue
+import threading
+from collections import deque
+from metrics import *
+from detections import Mapped_Result, to_numpy
+
+# Sentinel pushed downstream when a stage has no more items to produce
+END_OF_STREAM = object()
+
+
+class Stage_Meter:
+    """
+    Class for measuring the throughput of a single pipeline stage.
+
+    Attributes:
+        name (str): Name of the stage shown in throughput reports.
+        count (int): Number of items processed since the last report.
+        total (int): Number of items processed since the stage started.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize Stage_Meter with zeroed counters.
+
+        Args:
+            name (str): Name of the stage shown in throughput reports.
+        """
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.window_start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def tick(self, items=1):
+        """
+        Record that the stage has processed one or more items.
+
+        Args:
+            items (int): Number of items processed.
+        """
+        with self.lock:
+            self.count += items
+            self.total += items
+
+    def fps(self):
+        """
+        Return the throughput since the last call and start a new measuring window.
+
+        Returns:
+            fps (float): Items processed per second during the window.
+        """
+        with self.lock:
+            now = time.perf_counter()
+            elapsed = now - self.window_start
+            fps = self.count / elapsed if elapsed > 0 else 0.0
+            self.count = 0
+            self.window_start = now
+        return fps
+
+
+def throughput_report(meters):
+    """
+    Build a one-line throughput report for a list of stage meters.
+
+    Args:
+        meters (list): List of Stage_Meter objects in pipeline order.
+
+    Returns:
+        report (str): Report in the format "capture 25.0 fps | inference 8.1 fps | ...".
+    """
+    return " | ".join(f"{meter.name} {meter.fps():.1f} fps" for meter in meters)
+
+
+class Frame_Queue(queue.Queue):
+    """
+    Bounded queue of frames with a selectable policy for when it is full.
+
+    With the 'block' policy the producer waits for the consumer. With 'drop_oldest' the oldest queued frame
+    is discarded to make room, and with 'drop_newest' the new frame is discarded, so the producer never
+    waits and the queue never holds more than maxsize frames.
+
+    Attributes:
+        policy (str): 'block', 'drop_oldest' or 'drop_newest'.
+        dropped (int): Number of frames discarded because the queue was full.
+        name (str): Name of the queue in the dropped frames metric.
+    """
+
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, maxsize=32, policy='block', name='frames'):
+        """
+        Initialize Frame_Queue.
+
+        Args:
+            maxsize (int): Maximum number of frames in the queue.
+            policy (str): 'block', 'drop_oldest' or 'drop_newest'.
+            name (str): Name of the queue in the dropped frames metric.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+
+        super().__init__(maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.name = name
+        self.dropped_frames = DROPPED_FRAMES.labels(queue=name)
+
+    def offer(self, frame):
+        """
+        Put a frame on the queue according to the queue policy.
+
+        Args:
+            frame (numpy.ndarray): Frame to queue.
+
+        Returns:
+            bool: True if the frame was queued, False if it was discarded.
+        """
+        if self.policy == 'block':
+            self.put(frame)
+            return True
+
+        with self.not_full:
+            if self._qsize() >= self.maxsize:
+                self.dropped += 1
+                self.dropped_frames.inc()
+                if self.policy == 'drop_newest':
+                    return False
+                self._get()
+
+            self._put(frame)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+        return True
+
+    def report(self, name):
+        """
+        Build a short report of the queue depth and drop counter.
+
+        Args:
+            name (str): Name of the queue shown in the report.
+
+        Returns:
+            report (str): Report in the format "encode gate queue 3/32 dropped 0".
+        """
+        return f"{name} queue {self.qsize()}/{self.maxsize} dropped {self.dropped}"
+
+
+def is_live_stream(stream_path):
+    """
+    Check whether a video stream is live, a URL such as rtsp://... or the index of a local camera, rather than
+    a local file.
+
+    Args:
+        stream_path: Path or URL of the video stream, or the index of a local camera.
+
+    Returns:
+        bool: True for URLs and camera indices.
+    """
+    return isinstance(stream_path, int) or "://" in str(stream_path)
+
+
+class Stream_Reader:
+    """
+    Reader of a video stream that reconnects with backoff when a live stream fails, instead of ending.
+
+    Network streams are opened with as little buffering as OpenCV and FFmpeg allow, and the decode lag, how
+    far the decoded frames fall behind the stream, is measured from the stream timestamps.
+
+    Attributes:
+        stream_path (str): Path or URL of the input video stream, or the index of a camera.
+        reconnect (bool): Whether a failed read reopens the stream instead of ending it.
+        lag (float): Seconds the decoded frames lag behind the stream, or None before it can be measured.
+        reconnects (int): Number of times the stream was reopened.
+    """
+
+    def __init__(self, stream_path, name="capture", reconnect=None, stop=None, backoff=1.0, max_backoff=30.0):
+        """
+        Initialize Stream_Reader and open the video stream.
+
+        Args:
+            stream_path (str): Path or URL of the input video stream, or the index of a camera.
+            name (str): Name of the stream in the decode lag and reconnect metrics.
+            reconnect (bool): Whether a failed read reopens the stream, or None to reopen live streams only, so
+                local files end and missing ones fail right away.
+            stop (threading.Event): Event that interrupts the wait before reconnecting, or None to create one.
+            backoff (float): Seconds waited before the first reconnect attempt, doubled after every failed one.
+            max_backoff (float): Maximum number of seconds waited before a reconnect attempt.
+        """
+        self.stream_path = stream_path
+        self.reconnect = is_live_stream(stream_path) if reconnect is None else reconnect
+        self.stop = stop if stop is not None else threading.Event()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lag = None
+        self.reconnects = 0
+        self.read_seconds = STAGE_SECONDS.labels(stage="read")
+        self.decode_lag = DECODE_LAG.labels(stream=name)
+        self.reconnect_count = RECONNECTS.labels(stream=name)
+        self.cap = None
+        self.open()
+
+    def open(self):
+        """
+        Open the video stream and restart the decode lag measurement.
+        """
+        if self.reconnect:
+            # Ask FFmpeg not to buffer network streams, which adds seconds of lag, unless set otherwise
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "fflags;nobuffer|flags;low_delay")
+
+        self.cap = cv2.VideoCapture(self.stream_path)
+
+        if not self.reconnect and not self.cap.isOpened():
+            print(f"An error occurred: Unable to open the video file {self.stream_path}")
+
+        if self.reconnect:
+            # Keep a single decoded frame queued inside OpenCV, where the backend supports it
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.start_time = None
+        self.start_position = None
+
+    def read(self):
+        """
+        Read the next frame, reopening a live stream with exponential backoff while it fails.
+
+        Returns:
+            frame (numpy.ndarray): The next frame, or None once a local file has ended or the reader was stopped.
+        """
+        delay = self.backoff
+
+        while not self.stop.is_set():
+            with self.read_seconds.time():
+                ret, frame = self.cap.read()
+
+            if ret:
+                self.measure_lag()
+                return frame
+
+            if not self.reconnect:
+                print(f"An error occurred: Error reading frames from the live stream {self.stream_path}")
+                return None
+
+            print(f"An error occurred: Error reading frames from the live stream {self.stream_path}, "
+                  f"reconnecting in {delay:.0f} s")
+            self.cap.release()
+            if self.stop.wait(delay):
+                break
+            delay = min(delay * 2, self.max_backoff)
+
+            self.open()
+            self.reconnects += 1
+            self.reconnect_count.inc()
+
+        return None
+
+    def measure_lag(self):
+        """
+        Update the decode lag from the timestamp of the frame just read.
+
+        The lag is the time passed since the first frame after connecting minus the stream time passed, so it
+        grows while decoding falls behind a live stream. Recorded files read faster than real time have no lag.
+        """
+        position = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        now = time.perf_counter()
+
+        # Some streams have no timestamps
+        if position <= 0:
+            return
+
+        if self.start_time is None:
+            self.start_time = now
+            self.start_position = position
+            return
+
+        self.lag = max((now - self.start_time) - (position - self.start_position), 0.0)
+        self.decode_lag.set(self.lag)
+
+    def close(self):
+        """
+        Release the video stream.
+        """
+        self.cap.release()
+
+
+class Frame_Grabber(threading.Thread):
+    """
+    Capture stage that decodes a video stream in its own thread into a small buffer.
+
+    For live streams the buffer drops its oldest frame when a new one arrives while it is full, so a slow
+    consumer always receives recent images instead of an ever-growing backlog. For recorded files the thread
+    waits for room instead, so every frame is handed over. Live streams that fail are reopened by the
+    Stream_Reader, so the consumer only sees a gap in the frames.
+
+    Attributes:
+        stream_path (str): Path or URL of the input video stream.
+        keep_latest (bool): Whether the oldest unread frame is dropped when the buffer is full.
+        reader (Stream_Reader): Reader decoding and reconnecting the stream.
+        buffer (collections.deque): Decoded (frame, frame_time) pairs that have not been read yet.
+        meter (Stage_Meter): Throughput meter of the capture stage.
+        condition (threading.Condition): Condition notified whenever a new frame arrives.
+        frame_time (float): time.perf_counter() at which the frame last read was decoded.
+        stopped (bool): Whether the stream has ended or the grabber was stopped.
+    """
+
+    def __init__(self, stream_path, keep_latest=True, condition=None, name="capture", buffer_size=1,
+                 reconnect=None):
+        """
+        Initialize Frame_Grabber and open the video stream.
+
+        Args:
+            stream_path (str): Path or URL of the input video stream.
+            keep_latest (bool): Whether the oldest unread frame is dropped when the buffer is full.
+            condition (threading.Condition): Condition shared with other grabbers, or None to create one.
+            name (str): Name of the capture stage shown in throughput reports.
+            buffer_size (int): Maximum number of decoded frames waiting to be read.
+            reconnect (bool): Whether a failed read reopens the stream, or None to reopen live streams only.
+        """
+        super().__init__(daemon=True)
+        self.stream_path = stream_path
+        self.keep_latest = keep_latest
+        self.meter = Stage_Meter(name)
+        self.dropped_frames = DROPPED_FRAMES.labels(queue=name)
+        self.stop_event = threading.Event()
+        self.reader = Stream_Reader(stream_path, name, reconnect=reconnect, stop=self.stop_event)
+        self.buffer = deque(maxlen=max(int(buffer_size), 1))
+        self.frame_time = None
+        self.stopped = False
+        self.condition = condition if condition is not None else threading.Condition()
+
+    def run(self):
+        """
+        Decode frames from the stream until it ends or the grabber is stopped.
+        """
+        while not self.stopped:
+            frame = self.reader.read()
+            if frame is None:
+                break
+            frame_time = time.perf_counter()
+
+            with self.condition:
+                # Wait for the consumer when every frame has to be delivered
+                while not self.keep_latest and len(self.buffer) == self.buffer.maxlen and not self.stopped:
+                    self.condition.wait()
+
+                # Otherwise the buffer drops its oldest frame to make room
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped_frames.inc()
+
+                self.buffer.append((frame, frame_time))
+                self.condition.notify_all()
+
+            self.meter.tick()
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        self.reader.close()
+
+    def read(self, timeout=None):
+        """
+        Return the oldest frame that has not been read yet, waiting for one if necessary.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            frame (numpy.ndarray): The frame, or None if the stream has ended or the wait timed out.
+        """
+        with self.condition:
+            while not self.buffer and not self.stopped:
+                if not self.condition.wait(timeout):
+                    return None
+
+            if not self.buffer:
+                return None
+
+            return self.take()
+
+    def has_frame(self):
+        """
+        Check whether a frame is waiting to be read.
+
+        Returns:
+            bool: True if the buffer holds a frame that has not been read yet.
+        """
+        return len(self.buffer) > 0
+
+    def poll(self):
+        """
+        Return the oldest frame that has not been read yet without waiting.
+
+        Returns:
+            frame (numpy.ndarray): The frame, or None if no new frame has arrived.
+        """
+        with self.condition:
+            if not self.buffer:
+                return None
+
+            return self.take()
+
+    def take(self):
+        """
+        Remove the oldest frame from the buffer and wake the capture thread if it waits for room.
+
+        Called with the condition held.
+
+        Returns:
+            frame (numpy.ndarray): The frame.
+        """
+        frame, self.frame_time = self.buffer.popleft()
+        self.condition.notify_all()
+        return frame
+
+    def stop(self):
+        """
+        Signal the capture thread to stop reading frames, interrupting a wait before reconnecting.
+        """
+        self.stop_event.set()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class Batch_Collector:
+    """
+    Source for a batched inference stage that collects the next buffered frame of several Frame_Grabbers.
+
+    All grabbers must share the collector's condition so that a frame arriving on any stream wakes it.
+
+    Attributes:
+        grabbers (list): List of Frame_Grabber objects, one per stream.
+        condition (threading.Condition): Condition shared by all grabbers.
+    """
+
+    def __init__(self, grabbers, condition):
+        """
+        Initialize Batch_Collector.
+
+        Args:
+            grabbers (list): List of Frame_Grabber objects, one per stream.
+            condition (threading.Condition): Condition shared by all grabbers.
+        """
+        self.grabbers = grabbers
+        self.condition = condition
+
+    def __call__(self):
+        """
+        Wait until at least one stream has a new frame and collect the next frame of every such stream.
+
+        Returns:
+            batch (list): List of (stream_index, frame, frame_time) tuples, or None once every stream has ended.
+        """
+        with self.condition:
+            while not any(grabber.has_frame() for grabber in self.grabbers):
+                if all(grabber.stopped for grabber in self.grabbers):
+                    return None
+                self.condition.wait()
+
+            batch = []
+            for index, grabber in enumerate(self.grabbers):
+                frame = grabber.poll()
+                if frame is not None:
+                    batch.append((index, frame, grabber.frame_time))
+
+        return batch
+
+
+class Frame_Skipper:
+    """
+    Class for running the detector on every k-th frame only, with k adapted to the measured inference latency.
+
+    When an inference takes longer than the interval between frames, the frames in between are tracked by
+    prediction instead, so the detector keeps up with the cameras without falling behind.
+
+    Attributes:
+        frame_interval (float): Number of seconds between frames of the cameras.
+        max_skip (int): Largest k, 1 to run the detector on every frame.
+        k (int): Current number of frames per inference.
+        latency (float): Smoothed inference latency in seconds, or None before the first inference.
+    """
+
+    def __init__(self, frame_interval=0.05, max_skip=4, smoothing=0.2):
+        """
+        Initialize Frame_Skipper running the detector on every frame until the latency is measured.
+
+        Args:
+            frame_interval (float): Number of seconds between frames of the cameras.
+            max_skip (int): Largest k, 1 to run the detector on every frame.
+            smoothing (float): Weight of the newest latency measurement in the smoothed latency.
+        """
+        self.frame_interval = frame_interval
+        self.max_skip = max(int(max_skip), 1)
+        self.smoothing = smoothing
+        self.k = 1
+        self.latency = None
+        self.frame_count = 0
+
+    def due(self):
+        """
+        Count a frame and check whether it is run through the detector.
+
+        Returns:
+            bool: True for every k-th frame.
+        """
+        self.frame_count += 1
+        if self.frame_count >= self.k:
+            self.frame_count = 0
+            return True
+        return False
+
+    def update(self, latency):
+        """
+        Adapt k to a new inference latency measurement.
+
+        Args:
+            latency (float): Number of seconds the inference took.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+        self.k = min(max(math.ceil(self.latency / self.frame_interval), 1), self.max_skip)
+
+
+def detect_batch(model, frames, skipper, imgsz=640, gates=None, crops=None, sources=None):
+    """
+    Run the detector on a batch of resized frames, one per camera, skipping frames without motion and all
+    frames between every k-th batch.
+
+    Args:
+        model: The object detection model.
+        frames (list): List of 640x640 frames.
+        skipper (Frame_Skipper): Skipper deciding whether this batch is run through the detector.
+        imgsz (int): Input resolution of the model.
+        gates (list): Motion_Gate of the camera of every frame, or None to run the detector without motion.
+        crops (list): Crop_Region of the camera of every frame, or None to run the detector on whole frames.
+        sources (list): Frames the regions are cut from, such as the original frames, or None to cut them from
+            the resized frames.
+
+    Returns:
+        moving (list): Whether anything moves around the area of every frame.
+        results (list): Result of every frame with its boxes on the resized frame, or None for frames not run
+            through the detector.
+        latency (float): Number of seconds the prediction took, or None if the detector was not run.
+    """
+    # Check every frame for motion around the area, so the gates always compare consecutive frames
+    moving = [True] * len(frames) if gates is None else [gate.check(frame) for gate, frame in zip(gates, frames)]
+
+    # Predict the frames with motion in one forward pass, on every k-th batch
+    results = [None] * len(frames)
+    latency = None
+    selected = [i for i in range(len(frames)) if moving[i]]
+    if skipper.due() and selected:
+        if crops is not None:
+            # Cut the region around the area from every frame
+            sources = frames if sources is None else sources
+            inputs = [crops[i].prepare(sources[i]) for i in selected]
+            images = [image for image, _ in inputs]
+        else:
+            images = [frames[i] for i in selected]
+
+        start = time.perf_counter()
+        predicted = model.predict(images, imgsz=imgsz)
+        latency = time.perf_counter() - start
+        skipper.update(latency)
+
+        for n, (i, result) in enumerate(zip(selected, predicted)):
+            if crops is not None:
+                # Map the boxes back from the region to the resized frame
+                data = crops[i].map_boxes(to_numpy(result.boxes.data), inputs[n][1])
+                result = Mapped_Result(frames[i], data, result.names)
+            results[i] = result
+
+    return moving, results, latency
+
+
+class Pipeline_Stage(threading.Thread):
+    """
+    Worker thread that takes items from a source, processes them and passes the results on through a
+    bounded queue.
+
+    The bounded output queue applies backpressure: when the next stage falls behind, this stage blocks
+    instead of buffering without limit.
+
+    Attributes:
+        name (str): Name of the stage shown in throughput reports.
+        meter (Stage_Meter): Throughput meter of the stage.
+        output_queue (queue.Queue): Bounded queue feeding the next stage.
+    """
+
+    def __init__(self, name, func, source, output_queue, size=None):
+        """
+        Initialize Pipeline_Stage.
+
+        Args:
+            name (str): Name of the stage shown in throughput reports.
+            func (callable): Function applied to each item.
+            source (callable): Function returning the next item, or None when there are no more items.
+            output_queue (queue.Queue): Bounded queue feeding the next stage.
+            size (callable): Function returning the number of frames in a result, for batched stages.
+        """
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.size = size
+        self.source = source
+        self.output_queue = output_queue
+        self.meter = Stage_Meter(name)
+        self.stopped = False
+
+    def run(self):
+        """
+        Process items until the source is exhausted or the stage is stopped.
+        """
+        try:
+            while not self.stopped:
+                item = self.source()
+                if item is None:
+                    break
+
+                result = self.func(item)
+                self.meter.tick(self.size(result) if self.size is not None else 1)
+                self.put(result)
+        finally:
+            self.put(END_OF_STREAM)
+
+    def put(self, item):
+        """
+        Put an item on the output queue, giving up if the stage is stopped while waiting.
+
+        Args:
+            item: Item to pass to the next stage.
+        """
+        while True:
+            try:
+                self.output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stopped:
+                    return
+
+    def stop(self):
+        """
+        Signal the stage to stop after the current item.
+        """
+        self.stopped = True
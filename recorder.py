@@ -0,0 +1,159 @@
+import os
+import cv2
+import threading
+import numpy as np
+from datetime import datetime
+from pipeline import *
+from metrics import *
+
+
+class Event_Clip_Recorder:
+    """
+    Class for recording short clips around events instead of the whole day.
+
+    The most recent frames are copied into a ring buffer preallocated as one array. When an event is
+    triggered, a new clip is started with the buffered pre-roll frames, followed by the live frames until
+    post_roll seconds after the last trigger. Clips are encoded by a separate thread.
+
+    Attributes:
+        name (str): Name of the camera, used in clip file names.
+        directory (str): Directory the clips are saved to.
+        buffer (numpy.ndarray): Ring buffer of shape (pre_roll_frames, height, width, 3).
+        post_roll_frames (int): Number of frames recorded after the last trigger.
+        frames_left (int): Number of frames left to record in the current clip, 0 when not recording.
+        clip_count (int): Number of clips started.
+    """
+
+    def __init__(self, name, fps=20.0, frame_size=(640, 640), pre_roll=3.0, post_roll=3.0, directory='clips',
+                 queue_size=32, queue_policy='block'):
+        """
+        Initialize Event_Clip_Recorder and start its encode thread.
+
+        Args:
+            name (str): Name of the camera, used in clip file names.
+            fps (float): Frame rate of the clips.
+            frame_size (tuple): Width and height of the frames.
+            pre_roll (float): Number of seconds recorded before an event.
+            post_roll (float): Number of seconds recorded after an event.
+            directory (str): Directory the clips are saved to.
+            queue_size (int): Maximum number of frames waiting for the encode thread.
+            queue_policy (str): 'block', 'drop_oldest' or 'drop_newest' when the encode queue is full.
+        """
+        self.name = name
+        self.fps = fps
+        self.frame_size = frame_size
+        self.directory = directory
+
+        # Preallocate the ring buffer of pre-roll frames
+        width, height = frame_size
+        self.buffer = np.empty((max(int(pre_roll * fps), 1), height, width, 3), np.uint8)
+        self.head = 0
+        self.filled = 0
+
+        self.post_roll_frames = max(int(post_roll * fps), 1)
+        self.frames_left = 0
+        self.clip_count = 0
+        self.clip_path = None
+
+        # Encode stage: clips are written by a separate thread fed through a bounded queue
+        self.meter = Stage_Meter(f"clips {name}")
+        self.frame_queue = Frame_Queue(queue_size, queue_policy, name=f"clips {name}")
+        self.write_seconds = STAGE_SECONDS.labels(stage="write")
+        self.save_thread = threading.Thread(target=self.save_clips)
+        self.save_thread.start()
+
+    @property
+    def recording(self):
+        """
+        bool: Whether a clip is currently being recorded.
+        """
+        return self.frames_left > 0
+
+    def trigger(self):
+        """
+        Start a new clip with the buffered pre-roll frames, or extend the clip being recorded.
+        """
+        if not self.recording:
+            os.makedirs(self.directory, exist_ok=True)
+            clip_time = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            self.clip_count += 1
+            self.clip_path = os.path.join(self.directory,
+                                          f"SMARTVIEW-{self.name}-{clip_time}-{self.clip_count}.mp4")
+
+            # Queue copies of the pre-roll frames from oldest to newest, as the ring buffer keeps being overwritten
+            start = self.head - self.filled
+            for index in range(start, self.head):
+                self.frame_queue.offer((self.clip_path, self.buffer[index % len(self.buffer)].copy()))
+
+        self.frames_left = self.post_roll_frames
+
+    def add(self, frame):
+        """
+        Add a frame to the ring buffer, and to the current clip while recording.
+
+        Args:
+            frame (numpy.ndarray): Frame of the configured frame size.
+        """
+        self.buffer[self.head % len(self.buffer)] = frame
+        self.head += 1
+        self.filled = min(self.filled + 1, len(self.buffer))
+
+        if not self.recording:
+            return
+
+        self.frame_queue.offer((self.clip_path, frame))
+        self.frames_left -= 1
+
+        # Finish the clip once the post-roll has been recorded
+        if not self.recording:
+            self.frame_queue.put((self.clip_path, None))
+
+    def save_clips(self):
+        """
+        Encode stage: write queued clip frames to their clip files until None is received.
+
+        Every queued item names its clip file, so a frame dropped from a full queue never breaks a clip apart.
+        A None frame closes the clip.
+        """
+        out = None
+        out_path = None
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                break
+
+            clip_path, frame = item
+
+            # Close the previous clip when frames of a new clip arrive
+            if clip_path != out_path and out is not None:
+                out.release()
+                out = None
+
+            # Finish the clip once its post-roll has been written
+            if frame is None:
+                if out is not None:
+                    out.release()
+                out = None
+                out_path = None
+                continue
+
+            if out is None:
+                out = cv2.VideoWriter(clip_path, fourcc, self.fps, self.frame_size)
+                out_path = clip_path
+                print(f"Recording clip: {clip_path}")
+
+            with self.write_seconds.time():
+                out.write(frame)
+            self.meter.tick()
+
+        if out is not None:
+            out.release()
+
+    def stop(self):
+        """
+        Finish the current clip and stop the encode thread.
+        """
+        self.frame_queue.put(None)
+        self.save_thread.join()
@@ -0,0 +1,321 @@
+import cv2
+import numpy as np
+
+
+class Zone:
+    """
+    Class for an area of interest compiled once into a polygon array and a rasterized mask.
+
+    Attributes:
+        polygon (numpy.ndarray): Points of the area polygon as an int32 array, ready for drawing.
+        mask (numpy.ndarray): Mask of the frame that is 1 inside and on the border of the polygon.
+    """
+
+    def __init__(self, area_polygon, frame_size=(640, 640)):
+        """
+        Initialize Zone and rasterize the area polygon.
+
+        Args:
+            area_polygon (list): List of points defining the area polygon.
+            frame_size (tuple): Width and height of the frames the polygon is defined on.
+        """
+        self.polygon = np.array(area_polygon, np.int32)
+
+        # Fill the polygon, which gets the pixels within the edges right but not all pixels along them
+        width, height = frame_size
+        self.mask = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(self.mask, [self.polygon], 1)
+
+        # Test the pixels along the edges one by one, so the mask matches cv2.pointPolygonTest(...) >= 0
+        border = np.zeros_like(self.mask)
+        cv2.polylines(border, [self.polygon], True, 1, 3)
+        ys, xs = np.nonzero(border)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            self.mask[y, x] = cv2.pointPolygonTest(self.polygon, (x, y), False) >= 0
+
+    def contains(self, points):
+        """
+        Check for every point whether it lies within the area polygon.
+
+        Args:
+            points (numpy.ndarray): Integer array of shape (N, 2) with [x, y] rows.
+
+        Returns:
+            inside (numpy.ndarray): Boolean array that is True for points within the polygon.
+        """
+        points = np.asarray(points, np.int64).reshape(-1, 2)
+        height, width = self.mask.shape
+
+        # Points outside the frame are never within the polygon
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        inside[inside] = self.mask[points[inside, 1], points[inside, 0]] > 0
+        return inside
+
+    def draw(self, frame, color=(0, 255, 0), thickness=1):
+        """
+        Draw the area polygon on a frame.
+
+        Args:
+            frame (numpy.ndarray): Frame to draw on.
+            color (tuple): BGR color of the polygon.
+            thickness (int): Thickness of the polygon lines.
+        """
+        cv2.polylines(frame, [self.polygon], True, color, thickness)
+
+
+class Crop_Region:
+    """
+    Class for a padded rectangle around an area of interest that is cut from the full-resolution frame and
+    letterboxed into a small square detector input, instead of squashing the whole frame.
+
+    The rectangle is defined on the frames the zone is defined on, and cut from the original frame at its
+    own resolution, so the detector sees the area undistorted and at full detail.
+
+    Attributes:
+        rect (tuple): Left, top, right and bottom of the rectangle on the zone's frames.
+        frame_size (tuple): Width and height of the frames the zone is defined on.
+        imgsz (int): Size of the square detector input.
+    """
+
+    def __init__(self, zone, padding=128, imgsz=320):
+        """
+        Initialize Crop_Region around the area polygon of a zone.
+
+        Args:
+            zone (Zone): Area of interest.
+            padding (int): Number of pixels the rectangle around the polygon is padded by, enough to keep whole
+                objects whose center is in the area.
+            imgsz (int): Size of the square detector input.
+        """
+        height, width = zone.mask.shape
+        x, y, w, h = cv2.boundingRect(zone.polygon)
+        self.rect = (max(x - padding, 0), max(y - padding, 0), min(x + w + padding, width),
+                     min(y + h + padding, height))
+        self.frame_size = (width, height)
+        self.imgsz = imgsz
+
+    def prepare(self, frame):
+        """
+        Cut the rectangle from a frame of any resolution and letterbox it into the detector input.
+
+        Args:
+            frame (numpy.ndarray): Original frame.
+
+        Returns:
+            image (numpy.ndarray): Letterboxed image of shape (imgsz, imgsz, 3).
+            transform (tuple): Scale and offsets mapping the image back to the zone's frames, for map_boxes.
+        """
+        # Scale the rectangle from the zone's frames to the original frame
+        frame_height, frame_width = frame.shape[:2]
+        scale_x = frame_width / self.frame_size[0]
+        scale_y = frame_height / self.frame_size[1]
+        left, top, right, bottom = self.rect
+        x0, y0 = int(left * scale_x), int(top * scale_y)
+        x1, y1 = int(np.ceil(right * scale_x)), int(np.ceil(bottom * scale_y))
+        crop = frame[y0:y1, x0:x1]
+
+        # Resize the crop to fit the input, keeping its aspect ratio, and center it on a gray canvas
+        ratio = min(self.imgsz / crop.shape[1], self.imgsz / crop.shape[0])
+        resized_width = max(round(crop.shape[1] * ratio), 1)
+        resized_height = max(round(crop.shape[0] * ratio), 1)
+        pad_x = (self.imgsz - resized_width) // 2
+        pad_y = (self.imgsz - resized_height) // 2
+
+        image = np.full((self.imgsz, self.imgsz, 3), 114, np.uint8)
+        image[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = cv2.resize(
+            crop, (resized_width, resized_height), interpolation=cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR)
+
+        # Input x maps to ((x - pad_x) / ratio + x0) / scale_x on the zone's frames
+        transform = (ratio, pad_x, pad_y, x0, y0, scale_x, scale_y)
+        return image, transform
+
+    def map_boxes(self, data, transform):
+        """
+        Map detections on a letterboxed image back to the frames the zone is defined on.
+
+        Args:
+            data (numpy.ndarray): Detections of shape (N, 6) in the format [x1, y1, x2, y2, confidence, class_id].
+            transform (tuple): Transform returned by prepare.
+
+        Returns:
+            data (numpy.ndarray): Copy of the detections with the boxes on the zone's frames.
+        """
+        ratio, pad_x, pad_y, x0, y0, scale_x, scale_y = transform
+        data = np.array(data, np.float32).reshape(-1, 6)
+        data[:, [0, 2]] = ((data[:, [0, 2]] - pad_x) / ratio + x0) / scale_x
+        data[:, [1, 3]] = ((data[:, [1, 3]] - pad_y) / ratio + y0) / scale_y
+        return data
+
+    def draw(self, frame, color=(128, 128, 128), thickness=1):
+        """
+        Draw the rectangle on a frame.
+
+        Args:
+            frame (numpy.ndarray): Frame to draw on.
+            color (tuple): BGR color of the rectangle.
+            thickness (int): Thickness of the rectangle lines.
+        """
+        left, top, right, bottom = self.rect
+        cv2.rectangle(frame, (left, top), (right - 1, bottom - 1), color, thickness)
+
+
+class Motion_Gate:
+    """
+    Class for a cheap frame-difference check of whether anything moves around an area of interest.
+
+    Only a padded rectangle around the area polygon is compared, at a reduced scale, with the same region of
+    the previous frame. The gate stays open for a number of frames after the last motion, so the detector
+    still sees objects settling or leaving.
+
+    Attributes:
+        region (tuple): Slices of the frame rows and columns that are compared.
+        scale (float): Factor the region is scaled by before comparing.
+        threshold (int): Gray level difference above which a pixel has changed.
+        min_fraction (float): Fraction of changed pixels above which the region is moving.
+        hold (int): Number of frames the gate stays open after the last motion.
+    """
+
+    def __init__(self, zone, padding=40, scale=0.25, threshold=25, min_fraction=0.002, hold=10):
+        """
+        Initialize Motion_Gate around the area polygon of a zone.
+
+        Args:
+            zone (Zone): Area of interest.
+            padding (int): Number of pixels the rectangle around the polygon is padded by.
+            scale (float): Factor the region is scaled by before comparing.
+            threshold (int): Gray level difference above which a pixel has changed.
+            min_fraction (float): Fraction of changed pixels above which the region is moving.
+            hold (int): Number of frames the gate stays open after the last motion.
+        """
+        height, width = zone.mask.shape
+        x, y, w, h = cv2.boundingRect(zone.polygon)
+        self.region = (slice(max(y - padding, 0), min(y + h + padding, height)),
+                       slice(max(x - padding, 0), min(x + w + padding, width)))
+        self.scale = scale
+        self.threshold = threshold
+        self.min_fraction = min_fraction
+        self.hold = hold
+        self.previous = None
+        self.idle = 0
+
+    def check(self, frame):
+        """
+        Compare a frame with the previous one and check whether the gate is open.
+
+        Args:
+            frame (numpy.ndarray): Frame of the size the zone is defined on.
+
+        Returns:
+            bool: True if something moved in the region within the last hold frames.
+        """
+        gray = cv2.cvtColor(frame[self.region], cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        if self.previous is None or self.previous.shape != small.shape:
+            moving = True
+        else:
+            changed = np.count_nonzero(cv2.absdiff(small, self.previous) > self.threshold)
+            moving = changed > self.min_fraction * small.size
+
+        self.previous = small
+        self.idle = 0 if moving else self.idle + 1
+        return self.idle <= self.hold
+
+
+class Counting_Line:
+    """
+    Class for a directional line through a gate that counts objects crossing it in one direction.
+
+    An object crosses the line when its center moves from the left-hand side to the right-hand side of the
+    line, as seen on screen when going from start to end, between the two end points. The drawn arrow points
+    to the right-hand side. Swap start and end to count the opposite direction.
+
+    Attributes:
+        start (numpy.ndarray): Start point of the line.
+        end (numpy.ndarray): End point of the line.
+        sides (dict): Dictionary mapping object IDs to their last [side, frame_number] entry.
+        max_age (int): Number of frames after which an unseen object's side is forgotten.
+    """
+
+    def __init__(self, start, end, max_age=30):
+        """
+        Initialize Counting_Line.
+
+        Args:
+            start (tuple): Start point of the line.
+            end (tuple): End point of the line.
+            max_age (int): Number of frames after which an unseen object's side is forgotten.
+        """
+        self.start = np.array(start, np.int64)
+        self.end = np.array(end, np.int64)
+        self.direction = self.end - self.start
+        self.length_squared = int(self.direction @ self.direction)
+        self.sides = {}
+        self.max_age = max_age
+        self.frame_number = 0
+
+    def side(self, points):
+        """
+        Calculate on which side of the line every point lies.
+
+        Args:
+            points (numpy.ndarray): Integer array of shape (N, 2) with [x, y] rows.
+
+        Returns:
+            sides (numpy.ndarray): 1 for the right-hand side, -1 for the left-hand side and 0 on the line.
+        """
+        offsets = np.asarray(points, np.int64).reshape(-1, 2) - self.start
+        return np.sign(self.direction[0] * offsets[:, 1] - self.direction[1] * offsets[:, 0])
+
+    def update(self, obj_ids, points):
+        """
+        Record the positions of tracked objects and find those that crossed the line since they were last seen.
+
+        Args:
+            obj_ids (numpy.ndarray): IDs of the tracked objects.
+            points (numpy.ndarray): Integer array of shape (N, 2) with the center point of every object.
+
+        Returns:
+            crossed (numpy.ndarray): Boolean array that is True for objects that crossed the line.
+        """
+        self.frame_number += 1
+        points = np.asarray(points, np.int64).reshape(-1, 2)
+        sides = self.side(points)
+
+        # Only crossings between the two end points of the line count
+        offsets = points - self.start
+        projection = offsets @ self.direction
+        within = (projection >= 0) & (projection <= self.length_squared)
+
+        previous = np.array([self.sides.get(obj_id, (0, 0))[0] for obj_id in obj_ids.tolist()], np.int64)
+        crossed = within & (previous < 0) & (sides > 0)
+
+        # Remember the last side an object was clearly on
+        for obj_id, side in zip(obj_ids.tolist(), sides.tolist()):
+            if side != 0:
+                self.sides[obj_id] = (side, self.frame_number)
+
+        # Periodically forget objects that have not been seen for a while
+        if self.frame_number % self.max_age == 0:
+            self.sides = {obj_id: entry for obj_id, entry in self.sides.items()
+                          if self.frame_number - entry[1] <= self.max_age}
+
+        return crossed
+
+    def draw(self, frame, color=(0, 255, 255), thickness=2):
+        """
+        Draw the counting line on a frame with an arrow pointing in the counted direction.
+
+        Args:
+            frame (numpy.ndarray): Frame to draw on.
+            color (tuple): BGR color of the line.
+            thickness (int): Thickness of the line.
+        """
+        cv2.line(frame, tuple(self.start.tolist()), tuple(self.end.tolist()), color, thickness)
+
+        # Draw the arrow from the middle of the line towards its right-hand side
+        middle = (self.start + self.end) // 2
+        normal = np.array([-self.direction[1], self.direction[0]], np.float64)
+        normal = normal / max(np.hypot(*normal), 1.0) * 20
+        tip = (middle + normal).astype(np.int64)
+        cv2.arrowedLine(frame, tuple(middle.tolist()), tuple(tip.tolist()), color, thickness)
@@ -0,0 +1,190 @@
+import threading
+from datetime import datetime, time, timedelta
+
+__all__ = ['Scheduled_Job', 'Report_Scheduler', 'report_jobs']
+
+
+class Scheduled_Job:
+    """
+    Class for a job that runs every day at a fixed time, or at a fixed interval counted from that time.
+
+    Attributes:
+        name (str): Name of the job shown in log messages.
+        at (datetime.time): Time of day the job runs at.
+        every (datetime.timedelta): Interval between runs, at most one day.
+        func (callable): Function called when the job runs.
+        args (tuple): Arguments passed to the function.
+        last_run (datetime): Scheduled time of the latest run, or None if the job has not run yet.
+    """
+
+    def __init__(self, name, at, func, args=(), every=timedelta(days=1)):
+        """
+        Initialize Scheduled_Job.
+
+        Args:
+            name (str): Name of the job shown in log messages.
+            at (datetime.time): Time of day the job runs at.
+            func (callable): Function called when the job runs.
+            args (tuple): Arguments passed to the function.
+            every (datetime.timedelta): Interval between runs, at most one day.
+        """
+        self.name = name
+        self.at = at
+        self.every = min(every, timedelta(days=1))
+        self.func = func
+        self.args = args
+        self.last_run = None
+
+    def latest_due(self, now):
+        """
+        Return the latest scheduled time of the job that is not after now.
+
+        Args:
+            now (datetime): Current date and time.
+
+        Returns:
+            due (datetime): Latest scheduled time of the job.
+        """
+        due = datetime.combine(now.date(), self.at)
+        return due + (now - due) // self.every * self.every
+
+    def next_due(self, now):
+        """
+        Return the next scheduled time of the job after now.
+
+        Args:
+            now (datetime): Current date and time.
+
+        Returns:
+            due (datetime): Next scheduled time of the job.
+        """
+        return self.latest_due(now) + self.every
+
+
+class Report_Scheduler(threading.Thread):
+    """
+    Thread that runs scheduled jobs at their time of day, independently of the frame loop.
+
+    The thread sleeps until the next job is due. Runs that were missed while the thread could not wake up in
+    time, for example under heavy load or after the clock jumped, are caught up in schedule order as long as
+    they are no older than max_delay. Runs scheduled before the scheduler started are never caught up.
+
+    Attributes:
+        jobs (list): List of Scheduled_Job objects.
+        max_delay (datetime.timedelta): Maximum lateness of a run that is still caught up.
+    """
+
+    def __init__(self, jobs, max_delay=timedelta(hours=1)):
+        """
+        Initialize Report_Scheduler.
+
+        Args:
+            jobs (list): List of Scheduled_Job objects.
+            max_delay (datetime.timedelta): Maximum lateness of a run that is still caught up.
+        """
+        super().__init__(name="scheduler", daemon=True)
+        self.jobs = jobs
+        self.max_delay = max_delay
+        self.started = None
+        self.stopped = threading.Event()
+
+    def due_jobs(self, now):
+        """
+        Find the jobs that are due and have not run yet, in the order they were scheduled.
+
+        Args:
+            now (datetime): Current date and time.
+
+        Returns:
+            due_jobs (list): List of (scheduled_time, job) tuples.
+        """
+        due_jobs = []
+        for job in self.jobs:
+            due = job.latest_due(now)
+            if due >= self.started and due != job.last_run and now - due <= self.max_delay:
+                due_jobs.append((due, job))
+
+        return sorted(due_jobs, key=lambda item: item[0])
+
+    def run(self):
+        """
+        Run due jobs and sleep until the next one is due, until the scheduler is stopped.
+        """
+        self.started = datetime.now()
+
+        while not self.stopped.is_set():
+            now = datetime.now()
+
+            for due, job in self.due_jobs(now):
+                job.last_run = due
+                if due < now - timedelta(seconds=1):
+                    print(f"Catching up {job.name} scheduled at {due:%H:%M:%S}")
+
+                try:
+                    job.func(*job.args)
+                except Exception as e:
+                    # Handle exceptions so that one failing job does not stop the others
+                    print(f"An error occurred in {job.name}: {str(e)}")
+
+            # Sleep until the next job is due, waking up at least every minute in case the clock changes
+            now = datetime.now()
+            wait = 60.0
+            for job in self.jobs:
+                wait = min(wait, (job.next_due(now) - now).total_seconds())
+            self.stopped.wait(max(wait, 0.0))
+
+    def stop(self):
+        """
+        Signal the scheduler to stop.
+        """
+        self.stopped.set()
+
+
+def report_jobs(hourly_report, total_report, export_report, clear_report, first_hour=6, last_hour=19,
+                report_second=time(0, 59, 59), first_row=4, sheet="Sheet1", date_cell="C1",
+                compliant_column="C", non_compliant_column="D", total_at=time(19, 0, 30), export_at=time(19, 1),
+                clear_at=time(19, 2), store_counts=None, store_every=timedelta(minutes=1)):
+    """
+    Build the daily reporting schedule.
+
+    An hourly report is written at report_second past every hour from first_hour until last_hour, into
+    consecutive rows starting at first_row. The total, export and clear jobs follow at the end of the day.
+    The counts are stored every store_every from midnight on.
+
+    Args:
+        hourly_report (callable): Function called as hourly_report(date_cell, compliant_cell, non_compliant_cell).
+        total_report (callable): Function writing the daily totals.
+        export_report (callable): Function exporting the daily and weekly reports from the count store.
+        clear_report (callable): Function clearing the sheet for the next day.
+        first_hour (int): Hour of the first hourly report interval.
+        last_hour (int): Hour at which the last hourly report interval ends.
+        report_second (datetime.time): Minute and second past the hour of the hourly reports.
+        first_row (int): Sheet row of the first hourly report.
+        sheet (str): Name of the sheet written to.
+        date_cell (str): Cell the current date is written to.
+        compliant_column (str): Column of the compliant counts.
+        non_compliant_column (str): Column of the non-compliant counts.
+        total_at (datetime.time): Time of the daily total.
+        export_at (datetime.time): Time of the daily export.
+        clear_at (datetime.time): Time the sheet is cleared for the next day.
+        store_counts (callable): Function storing the counts, or None to not store them.
+        store_every (datetime.timedelta): Interval between storing the counts.
+
+    Returns:
+        jobs (list): List of Scheduled_Job objects.
+    """
+    jobs = []
+
+    for row, hour in enumerate(range(first_hour, last_hour), start=first_row):
+        at = time(hour, report_second.minute, report_second.second)
+        args = (f"{sheet}!{date_cell}", f"{sheet}!{compliant_column}{row}", f"{sheet}!{non_compliant_column}{row}")
+        jobs.append(Scheduled_Job(f"report {hour:02d}:00-{hour + 1:02d}:00", at, hourly_report, args))
+
+    jobs.append(Scheduled_Job("total", total_at, total_report))
+    jobs.append(Scheduled_Job("export", export_at, export_report))
+    jobs.append(Scheduled_Job("clear", clear_at, clear_report))
+
+    if store_counts is not None:
+        jobs.append(Scheduled_Job("store counts", time(0, 0), store_counts, every=store_every))
+
+    return jobs
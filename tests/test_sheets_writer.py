@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import importlib
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The modules of the repository are flat top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials
+import excel
+
+
+class Fake_Sheets_Handler(BaseHTTPRequestHandler):
+    """
+    Handler of a local fake Sheets endpoint that records the batch requests and fails the first ones on demand.
+
+    Attributes:
+        requests (list): List of (kind, body) tuples of the requests received, kind being 'batchUpdate' or
+            'batchClear'.
+        failures (list): HTTP status codes returned, in order, before requests succeed again.
+    """
+
+    requests = []
+    failures = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        kind = "batchUpdate" if "batchUpdate" in self.path else "batchClear"
+        Fake_Sheets_Handler.requests.append((kind, body))
+
+        if Fake_Sheets_Handler.failures:
+            status = Fake_Sheets_Handler.failures.pop(0)
+            self.reply(status, {"error": {"code": status, "message": "Fake failure"}})
+        elif kind == "batchUpdate":
+            self.reply(200, {"totalUpdatedCells": len(body["data"])})
+        else:
+            self.reply(200, {"clearedRanges": body["ranges"]})
+
+    def reply(self, status, response):
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Sheets_Writer_Test(unittest.TestCase):
+    """
+    Tests of Sheets_Writer against a local fake Sheets endpoint.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Fake_Sheets_Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        # Point the Sheets client at the fake endpoint, which is read when excel is imported
+        os.environ["SMARTVIEW_SHEETS_ENDPOINT"] = f"http://127.0.0.1:{cls.server.server_port}/"
+        importlib.reload(excel)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        del os.environ["SMARTVIEW_SHEETS_ENDPOINT"]
+
+    def setUp(self):
+        Fake_Sheets_Handler.requests = []
+        Fake_Sheets_Handler.failures = []
+        excel.credentials = Credentials(token="test")
+        excel.service = None
+        self.directory = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.directory, "sheets_queue.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def queued_lines(self):
+        with open(self.queue_path) as queue_file:
+            return [line for line in queue_file if line.strip()]
+
+    def test_batches_updates_and_clears(self):
+        writer = excel.Sheets_Writer(self.queue_path)
+        writer.enqueue([
+            {"type": "update", "range": "C4", "values": [[5]]},
+            {"type": "update", "range": "D4", "values": [[2]]},
+            {"type": "update", "range": "C4", "values": [[7]]},
+        ])
+        writer.enqueue([
+            {"type": "clear", "range": "C4:C16"},
+            {"type": "clear", "range": "D4:D16"},
+            {"type": "clear", "range": "C4:C16"},
+        ])
+        writer.start()
+
+        self.assertTrue(writer.flush(timeout=10))
+        self.assertEqual([kind for kind, _ in Fake_Sheets_Handler.requests], ["batchUpdate", "batchClear"])
+
+        # Later writes to the same range replace earlier ones
+        update = Fake_Sheets_Handler.requests[0][1]
+        self.assertEqual(update["data"], [{"range": "D4", "values": [[2]]}, {"range": "C4", "values": [[7]]}])
+        self.assertEqual(Fake_Sheets_Handler.requests[1][1]["ranges"], ["C4:C16", "D4:D16"])
+        self.assertEqual(self.queued_lines(), [])
+
+    def test_retries_rate_limits_and_server_errors_with_backoff(self):
+        Fake_Sheets_Handler.failures = [429, 503, 500]
+        writer = excel.Sheets_Writer(self.queue_path, max_backoff=3.0)
+        writer.enqueue([{"type": "update", "range": "C17", "values": [[12]]}])
+
+        with mock.patch.object(excel.time, "sleep") as sleep:
+            writer.start()
+            self.assertTrue(writer.flush(timeout=10))
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0, 3.0])
+        self.assertEqual(len(Fake_Sheets_Handler.requests), 4)
+        self.assertEqual(self.queued_lines(), [])
+
+    def test_retries_missing_permissions_with_backoff(self):
+        Fake_Sheets_Handler.failures = [401, 403]
+        writer = excel.Sheets_Writer(self.queue_path)
+        writer.enqueue([{"type": "update", "range": "C17", "values": [[12]]}])
+
+        with mock.patch.object(excel.time, "sleep") as sleep:
+            writer.start()
+            self.assertTrue(writer.flush(timeout=10))
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0])
+        self.assertEqual(len(Fake_Sheets_Handler.requests), 3)
+
+    def test_drops_rejected_writes(self):
+        Fake_Sheets_Handler.failures = [400]
+        writer = excel.Sheets_Writer(self.queue_path)
+        writer.enqueue([{"type": "update", "range": "C17", "values": [[12]]}])
+
+        with mock.patch.object(excel.time, "sleep") as sleep:
+            writer.start()
+            self.assertTrue(writer.flush(timeout=10))
+
+        sleep.assert_not_called()
+        self.assertEqual(len(Fake_Sheets_Handler.requests), 1)
+
+    def test_drops_only_the_rejected_group(self):
+        updates = [{"type": "update", "range": "C4", "values": [[5]]}]
+        clears = [{"type": "clear", "range": "C4:C16"}, {"type": "clear", "range": "D4:D16"}]
+        later_updates = [{"type": "update", "range": "C17", "values": [[12]]}]
+
+        # The updates are rejected, then the writer stops while waiting to retry the clears
+        Fake_Sheets_Handler.failures = [400, 503]
+        writer = excel.Sheets_Writer(self.queue_path)
+        writer.enqueue(updates + clears + later_updates)
+        with mock.patch.object(excel.time, "sleep", side_effect=SystemExit), \
+                mock.patch.object(threading, "excepthook", lambda args: None):
+            writer.start()
+            writer.join(timeout=10)
+
+        self.assertEqual([kind for kind, _ in Fake_Sheets_Handler.requests], ["batchUpdate", "batchClear"])
+        self.assertEqual([json.loads(line) for line in self.queued_lines()], clears + later_updates)
+
+    def test_reloads_queue_after_failed_flush(self):
+        operations = [
+            {"type": "update", "range": "C4", "values": [[5]]},
+            {"type": "update", "range": "D4", "values": [[2]]},
+        ]
+
+        # The first writer fails to send and stops while waiting to retry, like a process that is shut down
+        Fake_Sheets_Handler.failures = [503]
+        writer = excel.Sheets_Writer(self.queue_path)
+        writer.enqueue(operations)
+        with mock.patch.object(excel.time, "sleep", side_effect=SystemExit), \
+                mock.patch.object(threading, "excepthook", lambda args: None):
+            writer.start()
+            writer.join(timeout=10)
+
+        self.assertFalse(writer.flush(timeout=0))
+        self.assertEqual([json.loads(line) for line in self.queued_lines()], operations)
+
+        # A new writer loads the queued writes and sends them
+        writer = excel.Sheets_Writer(self.queue_path)
+        self.assertEqual(writer.pending, operations)
+        writer.start()
+
+        self.assertTrue(writer.flush(timeout=10))
+        self.assertEqual(Fake_Sheets_Handler.requests[-1],
+                         ("batchUpdate", {"valueInputOption": "RAW", "data": [
+                             {"range": "C4", "values": [[5]]}, {"range": "D4", "values": [[2]]}]}))
+        self.assertEqual(self.queued_lines(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+import multiprocessing
+
+# The modules of the repository are flat top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import *
+from workers import *
+
+
+class Stage_Times_Test(unittest.TestCase):
+    """
+    Tests of the stage histograms sent from the capture processes to the main process through shared memory.
+    """
+
+    def test_shares_histograms_of_each_camera(self):
+        histogram = Histogram("test_stage_seconds", "Test stage durations", ["camera", "stage"])
+        size = len(histogram.buckets) + 2
+        stage_times = multiprocessing.Array('d', 2 * len(CAPTURE_STAGES) * size)
+
+        values = [histogram.labels(camera=1, stage=stage) for stage in CAPTURE_STAGES]
+        values[0].observe(0.002)
+        values[0].observe(0.02)
+        values[1].observe(0.0001)
+        share_stage_times(values, stage_times, 1)
+
+        # The first camera has not shared anything yet
+        self.assertEqual(stage_times[:len(CAPTURE_STAGES) * size], [0.0] * len(CAPTURE_STAGES) * size)
+
+        read = stage_times[len(CAPTURE_STAGES) * size:][:size]
+        self.assertEqual(read[:-1], values[0].snapshot()[0])
+        self.assertAlmostEqual(read[-1], 0.022)
+
+    def test_adds_counts_observed_elsewhere(self):
+        histogram = Histogram("test_stage_seconds", "Test stage durations", ["stage"])
+        value = histogram.labels(stage="read")
+        value.observe(0.002)
+
+        added = [0] * (len(histogram.buckets) + 1)
+        added[-1] = 2
+        value.add(added, 6.0)
+
+        counts, seconds = value.snapshot()
+        self.assertEqual(sum(counts), 3)
+        self.assertEqual(counts[-1], 2)
+        self.assertAlmostEqual(seconds, 6.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+# The modules of the repository are flat top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from pipeline import *
+
+
+class Stream_Reader_Test(unittest.TestCase):
+    """
+    Tests of Stream_Reader and Frame_Grabber on a short local video file.
+    """
+
+    frames = 5
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clip_path = os.path.join(self.directory, "clip.avi")
+
+        clip = cv2.VideoWriter(self.clip_path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (64, 48))
+        for index in range(self.frames):
+            clip.write(np.full((48, 64, 3), index * 40, np.uint8))
+        clip.release()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_live_streams(self):
+        self.assertTrue(is_live_stream("rtsp://127.0.0.1:8554/gate"))
+        self.assertTrue(is_live_stream(1))
+        self.assertFalse(is_live_stream(self.clip_path))
+        self.assertFalse(is_live_stream("missing.mp4"))
+
+    def test_local_file_ends(self):
+        reader = Stream_Reader(self.clip_path)
+        self.assertFalse(reader.reconnect)
+
+        read = 0
+        while reader.read() is not None:
+            read += 1
+        reader.close()
+
+        self.assertEqual(read, self.frames)
+        self.assertEqual(reader.reconnects, 0)
+
+    def test_missing_file_fails_right_away(self):
+        reader = Stream_Reader(os.path.join(self.directory, "missing.mp4"))
+
+        start = time.perf_counter()
+        self.assertIsNone(reader.read())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(reader.reconnects, 0)
+
+    def test_reconnects_after_failed_read(self):
+        reader = Stream_Reader(self.clip_path, reconnect=True, backoff=0.01)
+        for _ in range(self.frames):
+            self.assertIsNotNone(reader.read())
+
+        # The end of the file fails like a dropped stream, which is reopened from the start
+        self.assertIsNotNone(reader.read())
+        self.assertEqual(reader.reconnects, 1)
+        reader.close()
+
+    def test_stop_interrupts_backoff(self):
+        grabber = Frame_Grabber(os.path.join(self.directory, "missing.mp4"), reconnect=True)
+        grabber.reader.backoff = 30.0
+        grabber.start()
+        time.sleep(0.2)
+
+        start = time.perf_counter()
+        grabber.stop()
+        grabber.join(timeout=5.0)
+
+        self.assertFalse(grabber.is_alive())
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(grabber.reader.reconnects, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
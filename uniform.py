@@ -1,413 +1,738 @@
+import time
+from metrics import *
+
+# Time the startup from here, so the report includes the imports below
+startup = Startup_Timer()
+
 import os
+import argparse
 import cv2
-import time
 import queue
-import cvzone
 import threading
 import numpy as np
-import pandas as pd
 from excel import *
-from ultralytics import YOLO
+from backends import *
+from detections import *
 from object_tracker import *
-from datetime import datetime
+from pipeline import *
+from roi import *
+from recorder import *
+from scheduler import *
+from count_store import *
+from workers import *
+from hair import *
+from camera_config import *
+from functools import partial
+from datetime import datetime, timedelta
+
+startup.mark("imports")
 
 
-def process_bbox(area_polygon, input_frame, bounding_boxes, object_ids):
+def process_bbox(zone, bounding_boxes, object_ids, line=None):
     """
-    Process bounding boxes within the specified area polygon.
+    Count bounding boxes within the specified area polygon.
 
     Args:
-        area_polygon (list): List of points defining the area polygon.
-        input_frame (numpy.ndarray): Input frame.
-        bounding_boxes (list): List of bounding boxes in the format [xmin, ymin, xmax, ymax, obj_id].
-        object_ids (list): List of object IDs.
+        zone (Zone): Area polygon compiled into a mask.
+        bounding_boxes (list): List of bounding boxes in the format [xmin, ymin, xmax, ymax, obj_id, class_id].
+        object_ids (Counted_Ids): Counted object IDs with their class IDs.
+        line (Counting_Line): Counting line, or None to count every object seen in the area instead of only
+            those crossing the line.
 
     Returns:
-        input_frame (numpy.ndarray): Modified input frame with bounding boxes and object IDs drawn.
-        object_count (int): Number of objects detected in the area.
+        object_counts (numpy.ndarray): Number of objects detected in the area per compliance category.
     """
-    for bbox in bounding_boxes:
-        xmin, ymin, xmax, ymax, obj_id = bbox
-        cx = (xmin + xmax) // 2
-        cy = (ymin + ymax) // 2
-        result = cv2.pointPolygonTest(np.array(area_polygon, np.int32), (cx, cy), False)
+    now = time.monotonic()
+    boxes = np.asarray(bounding_boxes, np.int64).reshape(-1, 6)
+
+    # Check which centroids of the bounding boxes lie within the area polygon, all in one call
+    centroids = (boxes[:, 0:2] + boxes[:, 2:4]) // 2
+    inside = zone.contains(centroids)
 
-        # Check if the centroid of the bounding box lies within the area polygon
-        if result >= 0:
-            # Draw bounding box and object ID on the frame
-            cv2.rectangle(input_frame, (xmin, ymin), (xmax, ymax), (0, 0, 128), 3)
-            cvzone.putTextRect(input_frame, f'{obj_id}', (xmin, ymin), scale=1, thickness=2,
-                               colorT=(255, 255, 255), colorR=(0, 0, 128))
+    if line is None:
+        counted = inside
+    else:
+        # Count objects entering through the line, and keep refreshing the class of those already counted
+        crossed = line.update(boxes[:, 4], centroids)
+        known = np.array([obj_id in object_ids for obj_id in boxes[:, 4].tolist()], bool)
+        counted = crossed | (inside & known)
 
-            # Append object ID to the list if not already present
-            if obj_id not in object_ids:
-                object_ids.append(obj_id)
+    with object_ids.lock:
+        # Count the object IDs, or refresh them with their latest majority-vote class
+        for obj_id, class_id in boxes[counted, 4:6].tolist():
+            object_ids.add(obj_id, class_id, now)
 
-    # Calculate the number of objects detected in the area
-    object_count = len(object_ids)
+        # Forget object IDs that have left the area long ago
+        object_ids.evict(now)
 
-    return input_frame, object_count
+        # Get the number of objects detected in the area per compliance category
+        object_counts = object_ids.counts.copy()
 
+    return object_counts
 
-def process_video(stream_path, class_path, model, bsufcomply, bsumcomply, bsunoncomply, output_file_name):
+
+def draw_bbox(zone, input_frame, bounding_boxes):
     """
-    Process a video stream to detect classes of objects within frames, create a new video with annotations, and continuously save the frames to a video file.
+    Draw the bounding boxes within the specified area polygon.
 
     Args:
-        stream_path (str): Path to the input video stream.
-        class_path (str): Path to the file containing classes to detect.
-        model: The object detection model to use.
-        bsufcomply: Argument description for bsufcomply.
-        bsumcomply: Argument description for bsumcomply.
-        bsunoncomply: Argument description for bsunoncomply.
-        output_file_name (str): Name of the output video file.
+        zone (Zone): Area polygon compiled into a mask.
+        input_frame (numpy.ndarray): Input frame.
+        bounding_boxes (list): List of bounding boxes in the format [xmin, ymin, xmax, ymax, obj_id, class_id].
 
     Returns:
-        None
+        input_frame (numpy.ndarray): Modified input frame with bounding boxes and object IDs drawn.
+    """
+    # cvzone is only imported once frames are annotated, as it slows down startup
+    import cvzone
+
+    boxes = np.asarray(bounding_boxes, np.int64).reshape(-1, 6)
+    inside = zone.contains((boxes[:, 0:2] + boxes[:, 2:4]) // 2)
+
+    # Draw bounding box and object ID on the frame
+    for xmin, ymin, xmax, ymax, obj_id, _ in boxes[inside].tolist():
+        cv2.rectangle(input_frame, (xmin, ymin), (xmax, ymax), (0, 0, 128), 3)
+        cvzone.putTextRect(input_frame, f'{obj_id}', (xmin, ymin), scale=1, thickness=2,
+                           colorT=(255, 255, 255), colorR=(0, 0, 128))
+
+    return input_frame
+
+
+class Camera_Stream:
+    """
+    Class holding the state of one camera processed by process_video.
+
+    Every camera keeps its own tracker, area polygon, counted object IDs and output video, while the
+    detection model is shared by all cameras. When a counting line is given, objects are counted as they
+    cross it into the gate instead of whenever they are seen in the area.
+
+    Attributes:
+        name (str): Name of the camera, used in window titles and output file names.
+        stream_path (str): Path to the input video stream.
+        zone (Zone): Area polygon compiled into a mask.
+        line (Counting_Line): Directional counting line, or None to count by presence in the area.
+        output_file_name (str): Name of the output video file.
+        tracker (Object_Tracker): Tracker following objects of all compliance categories.
+        counted_ids (Counted_Ids): Object IDs counted in the area with their category.
+        counts (numpy.ndarray): Number of objects counted in the area per compliance category.
+        new_event (bool): Whether a new non-compliant object was counted in the latest frame.
+        gate (Motion_Gate): Frame-difference check of whether anything moves around the area.
+        crop (Crop_Region): Region around the area the detector runs on, or None to run it on the whole frame.
+        bbox_idx (list): Tracked bounding boxes of the latest frame.
+        clip_recorder (Event_Clip_Recorder): Recorder of non-compliance clips, or None when not recording events.
     """
 
-    # Open the video stream
-    cap = cv2.VideoCapture(stream_path)
+    def __init__(self, name, stream_path, area, output_file_name, line=None):
+        """
+        Initialize Camera_Stream with a fresh tracker and counts.
+
+        Args:
+            name (str): Name of the camera, used in window titles and output file names.
+            stream_path (str): Path to the input video stream.
+            area (list): List of points defining the area polygon.
+            output_file_name (str): Name of the output video file.
+            line (tuple): Start and end point of the counting line, or None to count by presence in the area.
+        """
+        self.name = name
+        self.stream_path = stream_path
+        self.area = area
+        self.zone = Zone(area)
+        self.line = Counting_Line(*line) if line is not None else None
+        self.output_file_name = output_file_name
+
+        # Initialize one object tracker that votes on the compliance category of every object
+        self.tracker = Object_Tracker(num_classes=len(CATEGORIES))
+
+        # Initialize bounded memory of counted object IDs and their compliance statuses
+        self.counted_ids = Counted_Ids(len(CATEGORIES))
+        self.counts = np.zeros(len(CATEGORIES), np.int64)
+        self.new_event = False
+        self.frame_count = 0
+
+        # Cheap motion check around the area, so the detector only runs when something moves
+        self.gate = Motion_Gate(self.zone)
+        self.crop = None
+        self.bbox_idx = []
+
+        # Optional second-stage hair colour check, caching its results per tracked person
+        self.hair = None
+
+        self.grabber = None
+        self.out = None
+        self.clip_recorder = None
+        self.encode_meter = Stage_Meter(f"encode {name}")
+
+        # Latency histograms of the per-camera stages and gauges of the counts
+        self.stage_seconds = {stage: STAGE_SECONDS.labels(stage=stage)
+                              for stage in ("parse", "track", "hair", "roi", "annotate", "enqueue", "write")}
+        self.count_gauges = [COUNTED_OBJECTS.labels(camera=name, category=category) for category in CATEGORIES]
+
+    def start(self, condition=None, record='all', queue_size=32, queue_policy='block', pre_roll=3.0,
+              post_roll=3.0, keep_latest=True, capture=True, buffer_size=1):
+        """
+        Open the video stream and output video and start the capture and encode threads.
+
+        Args:
+            condition (threading.Condition): Condition shared by the grabbers of all cameras.
+            record (str): 'all' to record into one output video, 'events' to record clips around non-compliance
+                events, or 'off' to record nothing.
+            queue_size (int): Maximum number of frames waiting for the encode thread.
+            queue_policy (str): 'block', 'drop_oldest' or 'drop_newest' when the encode queue is full.
+            pre_roll (float): Number of seconds recorded before a non-compliance event.
+            post_roll (float): Number of seconds recorded after a non-compliance event.
+            keep_latest (bool): Whether to keep only the newest frame of a live stream, or process every frame.
+            capture (bool): Whether to read the stream in a capture thread, or leave it to a capture process.
+            buffer_size (int): Maximum number of decoded frames waiting for the inference stage.
+        """
+        # Capture stage: decode the stream in its own thread into a small buffer, reconnecting live streams
+        if capture:
+            self.grabber = Frame_Grabber(self.stream_path, keep_latest=keep_latest, condition=condition,
+                                         name=f"capture {self.name}", buffer_size=buffer_size)
+            self.grabber.start()
+
+        if record == 'events':
+            self.clip_recorder = Event_Clip_Recorder(self.name, pre_roll=pre_roll, post_roll=post_roll,
+                                                     queue_size=queue_size, queue_policy=queue_policy)
 
-    # Define codec for video saving
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        if record != 'all':
+            return
 
-    # Get video properties
-    fps = 20.0
-    frame_width = 640
-    frame_height = 640
+        # Define codec for video saving
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
 
-    # Define output VideoWriter object
-    out = cv2.VideoWriter(output_file_name, fourcc, fps, (frame_width, frame_height))
+        # Get video properties
+        fps = 20.0
+        frame_width = 640
+        frame_height = 640
 
-    # Read class data from file
-    my_file = open(class_path, "r")
-    data = my_file.read()
-    class_list = data.split("\n")
+        # Define output VideoWriter object
+        self.out = cv2.VideoWriter(self.output_file_name, fourcc, fps, (frame_width, frame_height))
 
-    # Initialize lists to store compliance statuses
-    bsufcomply_list = []
-    bsumcomply_list = []
-    bsunoncomply_list = []
+        # Define a bounded queue to store frames for the encode stage, so recording uses a fixed amount of memory
+        self.frame_queue = Frame_Queue(queue_size, queue_policy, name=f"encode {self.name}")
 
-    # Define a queue to store frames for saving
-    frame_queue = queue.Queue()
+        # Create thread for saving frames
+        self.save_thread = threading.Thread(target=self.save_frames)
+        self.save_thread.start()
 
-    def save_frame(frame_queue_func):
+    def save_frames(self):
+        """
+        Encode stage: write queued frames to the output video until None is received.
+        """
         while True:
-            frame_func = frame_queue_func.get()
-            if frame_func is None:
+            frame = self.frame_queue.get()
+            if frame is None:
                 break
-            out.write(frame_func)
-
-    # Create thread for saving frames
-    save_thread = threading.Thread(target=save_frame, args=(frame_queue,))
-    save_thread.start()
-
-    # Define area of interest
-    area = [(0, 310), (0, 370), (628, 390), (615, 375)]
-
-    # Define time intervals
-    six_to_seven = False  # 6:00 am to 7:00 am
-    seven_to_eight = False  # 7:00 am to 8:00 am
-    eight_to_nine = False  # 8:00 am to 9:00 am
-    nine_to_ten = False  # 9:00 am to 10:00 am
-    ten_to_eleven = False  # 10:00 am to 11:00 am
-    eleven_to_twelve = False  # 11:00 am to 12:00 pm
-    twelve_to_thirteen = False  # 12:00 am to 1:00 pm
-    thirteen_to_fourteen = False  # 1:00 pm to 2:00 pm
-    fourteen_to_fifteen = False  # 2:00 pm to 3:00 pm
-    fifteen_to_sixteen = False  # 3:00 pm to 4:00 pm
-    sixteen_to_seventeen = False  # 4:00 pm to 5:00 pm
-    seventeen_to_eighteen = False  # 5:00 pm to 6:00 pm
-    eighteen_to_nineteen = False  # 6:00 pm to 7:00 pm
-    nineteen = False  # 7:00 pm
-    nineteen_one = False  # 7:01 pm
-    nineteen_two = False  # 7:02 pm
+            with self.stage_seconds["write"].time():
+                self.out.write(frame)
+            self.encode_meter.tick()
 
-    while True:
-        # Read frame from the video stream
-        ret, frame = cap.read()
+    def update(self, result, class_table, moving=True):
+        """
+        Track and count the objects detected in a frame.
 
-        try:
-            # Check if frame reading was successful
-            if not ret:
-                raise Exception("Error reading frames from the live stream")
-        except Exception as e:
-            # Handle exceptions
-            print(f"An error occurred: {str(e)}")
-            break
+        Frames that were not run through the detector are tracked by prediction while something moves around
+        the area, and keep the boxes of the previous frame otherwise.
+
+        Args:
+            result: Detection result of the model for the frame, or None if the detector was not run.
+            class_table (numpy.ndarray): Table mapping class IDs to compliance categories.
+            moving (bool): Whether anything moves around the area.
+
+        Returns:
+            bbox_idx (list): List of tracked bounding boxes in the format [x1, y1, x2, y2, obj_id, class_id].
+        """
+        self.frame_count += 1
+        self.new_event = False
+
+        if result is not None:
+            # Extract the bounding boxes and compliance categories of detected objects
+            with self.stage_seconds["parse"].time():
+                boxes, categories = parse_detections(result.boxes.data, class_table)
+
+            # Track objects of all categories in one pass, smoothing each object's category over time
+            with self.stage_seconds["track"].time():
+                rects = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2]))
+                tracked = self.tracker.update(rects, categories)
+        elif moving:
+            # Move the tracked objects along their velocity for a frame skipped by the detector
+            with self.stage_seconds["track"].time():
+                tracked = self.tracker.predict(with_classes=True)
+        else:
+            # Nothing moves around the area, so the objects are where they were
+            return self.bbox_idx
+
+        # Convert the tracked [x, y, w, h] boxes back to corner points
+        bbox_idx = np.asarray(tracked, np.int64).reshape(-1, 6)
+        bbox_idx[:, 2:4] += bbox_idx[:, 0:2]
+
+        # Count people with non-standard hair as non-compliant, classifying every person only a few times
+        if self.hair is not None:
+            with self.stage_seconds["hair"].time():
+                self.hair.update(result.orig_img if result is not None else None, bbox_idx, self.frame_count)
+
+        bbox_idx = self.bbox_idx = bbox_idx.tolist()
+
+        # Process bounding boxes within specified area
+        previous_noncompliant = self.counts[2]
+        with self.stage_seconds["roi"].time():
+            self.counts = process_bbox(self.zone, bbox_idx, self.counted_ids, self.line)
+        for gauge, count in zip(self.count_gauges, self.counts.tolist()):
+            gauge.set(count)
+
+        # A non-compliance event happens when a new non-compliant object is counted
+        self.new_event = self.counts[2] > previous_noncompliant
+
+        return bbox_idx
+
+    def annotate(self, frame, result, bbox_idx):
+        """
+        Draw the detections, area polygon and counts of a frame.
+
+        Args:
+            frame (numpy.ndarray): Frame the detections were made on.
+            result: Detection result of the model for the frame, or None if the detector was not run.
+            bbox_idx (list): Tracked bounding boxes returned by update.
+
+        Returns:
+            annotated_frame (numpy.ndarray): Frame with detections, area polygon and counts drawn.
+        """
+        # Plot annotated frame with detected objects, or only the tracked boxes when the detector was not run
+        annotated_frame = result.plot() if result is not None else frame.copy()
+
+        # Annotate bounding boxes within specified area
+        annotated_frame = draw_bbox(self.zone, annotated_frame, bbox_idx)
 
-        # Resize frame
-        frame = cv2.resize(frame, (640, 640))
-
-        # Predict objects in the frame using the provided model
-        results = model.predict(frame)
-        a = results[0].boxes.data
-        px = pd.DataFrame(a).astype("float")
-
-        # Plot annotated frame with detected objects
-        annotated_frame = results[0].plot()
-
-        # Initialize lists to store bounding boxes for each class
-        bounding_list = []
-        bounding_list1 = []
-        bounding_list2 = []
-
-        # Iterate through detected objects
-        for index, row in px.iterrows():
-            x1 = int(row[0])
-            y1 = int(row[1])
-            x2 = int(row[2])
-            y2 = int(row[3])
-
-            d = int(row[5])
-            c = class_list[d]
-
-            # Classify objects into respective compliance categories
-            if 'bsufcomply' in c:
-                bounding_list.append([x1, y1, x2, y2])
-            elif 'bsumcomply' in c:
-                bounding_list1.append([x1, y1, x2, y2])
-            elif 'bsunoncomply' in c:
-                bounding_list2.append([x1, y1, x2, y2])
-
-        # Update bounding box indices for each compliance category
-        bbox_idx = bsufcomply.update(bounding_list)
-        bbox1_idx = bsumcomply.update(bounding_list1)
-        bbox2_idx = bsunoncomply.update(bounding_list2)
-
-        # Process and annotate bounding boxes within specified area
-        annotated_frame, bsufcomply_count = process_bbox(area, annotated_frame, bbox_idx, bsufcomply_list)
-        annotated_frame, bsumcomply_count = process_bbox(area, annotated_frame, bbox1_idx, bsumcomply_list)
-        annotated_frame, bsunoncomply_count = process_bbox(area, annotated_frame, bbox2_idx, bsunoncomply_list)
-
-        # Calculate total counts of compliant and non-compliant objects
-        compliant_count = bsufcomply_count + bsumcomply_count
-        non_compliant_count = bsunoncomply_count
-
-        # Draw a polygon around the specified area
-        cv2.polylines(annotated_frame, [np.array(area, np.int32)], True, (0, 255, 0), 1)
+        # Draw a polygon around the specified area and the counting line
+        self.zone.draw(annotated_frame)
+        if self.crop is not None:
+            self.crop.draw(annotated_frame)
+        if self.line is not None:
+            self.line.draw(annotated_frame)
 
         # Display counts of compliant and non-compliant objects on the annotated frame
-        cvzone.putTextRect(annotated_frame, f'BSUFCOMPLY: {bsufcomply_count}', (30, 600),
+        import cvzone
+
+        cvzone.putTextRect(annotated_frame, f'BSUFCOMPLY: {self.counts[0]}', (30, 600),
                            scale=1, thickness=2, colorT=(255, 255, 255), colorR=(0, 0, 128),
                            border=1, colorB=(0, 255, 255))
-        cvzone.putTextRect(annotated_frame, f'BSUMCOMPLY: {bsumcomply_count}', (250, 600),
+        cvzone.putTextRect(annotated_frame, f'BSUMCOMPLY: {self.counts[1]}', (250, 600),
                            scale=1, thickness=2, colorT=(255, 255, 255), colorR=(0, 0, 128),
                            border=1, colorB=(0, 255, 255))
-        cvzone.putTextRect(annotated_frame, f'BSUNONCOMPLY: {bsunoncomply_count}', (450, 600),
+        cvzone.putTextRect(annotated_frame, f'BSUNONCOMPLY: {self.counts[2]}', (450, 600),
                            scale=1, thickness=2, colorT=(255, 255, 255), colorR=(0, 0, 128),
                            border=1, colorB=(0, 255, 255))
 
-        # Get the current time
-        current_time = datetime.now().time()
+        return annotated_frame
 
+    def take_counts(self):
         """
-        This code segment implements a time-based scheduler to perform tasks at specific intervals.
-        It first checks if the current time falls within the operational time range of 05:00 to 20:00.
-        Within this range, it further examines the hour, minute, and second to determine which task to execute.
+        Return the counts of the reporting interval that ended and clear the counted object IDs.
 
-        Tasks involve data extraction for each one-hour interval from 6 AM to 7 PM.
-        Each task is executed in a separate thread to enable concurrent processing.
-        After processing data for an interval, relevant lists are cleared to prepare for the next hour.
+        Returns:
+            counts (numpy.ndarray): Number of objects counted in the area per compliance category.
+        """
+        return self.counted_ids.take()
 
-        At the end of the day, after the last hour interval (19:00 to 20:00), additional tasks are performed.
-        These tasks include clearing data from a Google sheet and resetting flags for the next cycle.
+    def stop(self):
+        """
+        Stop the capture and encode threads and release the output video.
         """
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber.join()
 
-        if datetime.strptime("05:00", "%H:%M").time() <= current_time <= datetime.strptime("20:00", "%H:%M").time():
-            if current_time.hour == 6 and current_time.minute == 59 and current_time.second == 59 and not six_to_seven:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C4", "Sheet1!D4",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                six_to_seven = True
-                nineteen_two = False
-            elif current_time.hour == 7 and current_time.minute == 59 and current_time.second == 59 and not seven_to_eight:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C5", "Sheet1!D5",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                seven_to_eight = True
-            elif current_time.hour == 8 and current_time.minute == 59 and current_time.second == 59 and not eight_to_nine:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C6", "Sheet1!D6",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                eight_to_nine = True
-            elif current_time.hour == 9 and current_time.minute == 59 and current_time.second == 59 and not nine_to_ten:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C7", "Sheet1!D7",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                nine_to_ten = True
-            elif current_time.hour == 10 and current_time.minute == 59 and current_time.second == 59 and not ten_to_eleven:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C8", "Sheet1!D8",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                ten_to_eleven = True
-            elif current_time.hour == 11 and current_time.minute == 59 and current_time.second == 59 and not eleven_to_twelve:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C9", "Sheet1!D9",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                eleven_to_twelve = True
-            elif current_time.hour == 12 and current_time.minute == 59 and current_time.second == 59 and not twelve_to_thirteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C10", "Sheet1!D10",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                twelve_to_thirteen = True
-            elif current_time.hour == 13 and current_time.minute == 59 and current_time.second == 59 and not thirteen_to_fourteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C11", "Sheet1!D11",
-                                                                      compliant_count,
-                                                                      non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                thirteen_to_fourteen = True
-            elif current_time.hour == 14 and current_time.minute == 59 and current_time.second == 59 and not fourteen_to_fifteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C12", "Sheet1!D12",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                fourteen_to_fifteen = True
-            elif current_time.hour == 15 and current_time.minute == 59 and current_time.second == 59 and not fifteen_to_sixteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C13", "Sheet1!D13",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                fifteen_to_sixteen = True
-            elif current_time.hour == 16 and current_time.minute == 59 and current_time.second == 59 and not sixteen_to_seventeen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C14", "Sheet1!D14",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                sixteen_to_seventeen = True
-            elif current_time.hour == 17 and current_time.minute == 59 and current_time.second == 59 and not seventeen_to_eighteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C15", "Sheet1!D15",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                seventeen_to_eighteen = True
-            elif current_time.hour == 18 and current_time.minute == 59 and current_time.second == 59 and not eighteen_to_nineteen:
-                google_sheet_raw_data_thread = threading.Thread(target=google_sheet_raw_data,
-                                                                args=("Sheet1!C1", "Sheet1!C16", "Sheet1!D16",
-                                                                      compliant_count, non_compliant_count))
-                google_sheet_raw_data_thread.start()
-                bsufcomply_list.clear()
-                bsumcomply_list.clear()
-                bsunoncomply_list.clear()
-                eighteen_to_nineteen = True
-            elif current_time.hour == 19 and current_time.minute == 0 and current_time.second == 30 and not nineteen:
-                print("Total")
-                google_sheet_total_data_thread = threading.Thread(target=google_sheet_total_data)
-                google_sheet_total_data_thread.start()
-                nineteen = True
-            elif current_time.hour == 19 and current_time.minute == 1 and current_time.second == 0 and not nineteen_one:
-                print("Download")
-                download_google_sheet_and_save_thread = threading.Thread(target=download_google_sheet_and_save)
-                download_google_sheet_and_save_thread.start()
-                nineteen_one = True
-            elif current_time.hour == 19 and current_time.minute == 2 and current_time.second == 0 and not nineteen_two:
-                print("Clear")
-                clear_google_sheet_data_thread = threading.Thread(target=clear_google_sheet_data)
-                clear_google_sheet_data_thread.start()
-                nineteen_two = True
-                six_to_seven = False
-                seven_to_eight = False
-                eight_to_nine = False
-                nine_to_ten = False
-                ten_to_eleven = False
-                eleven_to_twelve = False
-                twelve_to_thirteen = False
-                thirteen_to_fourteen = False
-                fourteen_to_fifteen = False
-                fifteen_to_sixteen = False
-                sixteen_to_seventeen = False
-                seventeen_to_eighteen = False
-                eighteen_to_nineteen = False
-                nineteen = False
-                nineteen_one = False
-            else:
-                pass
+        if self.clip_recorder is not None:
+            self.clip_recorder.stop()
 
-        frame_queue.put(annotated_frame)
+        if self.out is None:
+            return
 
-        # Display the annotated frame in a window titled "SMARTVIEW"
-        cv2.imshow("SMARTVIEW", annotated_frame)
+        # Signal the save thread to stop
+        self.frame_queue.put(None)
+        self.save_thread.join()
 
-        # Wait for a key press event, if the pressed key is ESC (key code 27), break the loop
-        if cv2.waitKey(1) & 0xFF == 27:
+        # Release resources
+        self.out.release()
+
+
+def process_video(cameras, class_path, model, display=True, annotate_every=1, record='all', queue_size=32,
+                  queue_policy='block', pre_roll=3.0, post_roll=3.0, store_path='smartview_counts.db', imgsz=640,
+                  motion_gate=True, max_skip=4, crop=False, metrics_port=9108, keep_latest=True, reports=True,
+                  latencies=None, workers=0, capture_buffer=1, hair_model=None, startup=None):
+    """
+    Process one or more video streams to detect classes of objects within frames, create new videos with annotations, and continuously save the frames to video files.
+
+    The newest frame of every camera is collected into a batch and predicted in a single forward pass of
+    the shared model, after which each camera tracks and counts its own detections. Frames are only
+    annotated when they are displayed or recorded, so a headless run without recording only counts.
+
+    The detector is skipped for a camera while nothing moves around its area. While the detector is slower
+    than the cameras it only runs on every k-th frame, with the objects tracked by prediction in between.
+    In crop mode the detector only sees a padded region around each area, cut from the original frame and
+    letterboxed to imgsz, and its boxes are mapped back to the 640x640 frame.
+
+    With workers, capture and inference run in separate processes that pass frames through shared memory
+    instead of threads sharing one GIL, and this process only tracks, counts, annotates and reports.
+
+    With a hair model, the head of every tracked person is classified on a few detector frames, and people
+    with non-standard hair are counted as non-compliant.
+
+    Live streams that fail are reopened with backoff, while the trackers and counts of their cameras carry
+    on across the gap.
+
+    The models are warmed up on blank frames before the streams are opened, so the first live frames are
+    not held up by the lazy initialisation of the backend.
+
+    Counts are appended every minute to a local count store, from which the daily totals and report are
+    calculated. The Google Sheet is only a best-effort replica of the store.
+
+    Args:
+        cameras (list): List of Camera_Stream objects to process.
+        class_path (str): Path to the file containing classes to detect.
+        model: The object detection model to use, or with workers a picklable function without arguments that
+            loads it in every inference process.
+        display (bool): Whether to show the annotated frames in a window.
+        annotate_every (int): Annotate, display and record only every n-th frame, or never if 0.
+        record (str): 'all' to record annotated frames, 'events' to record short clips around non-compliance
+            events, or 'off' to record nothing.
+        queue_size (int): Maximum number of frames waiting for the encode thread of each camera.
+        queue_policy (str): 'block', 'drop_oldest' or 'drop_newest' when an encode queue is full.
+        pre_roll (float): Number of seconds recorded before a non-compliance event.
+        post_roll (float): Number of seconds recorded after a non-compliance event.
+        store_path (str): Path of the SQLite database storing the counts.
+        imgsz (int): Input resolution of the model.
+        motion_gate (bool): Whether to skip the detector while nothing moves around the area of a camera.
+        max_skip (int): Largest number of frames per inference when the detector is slower than the cameras.
+        crop (bool): Whether to run the detector on a letterboxed region around each area instead of the whole
+            frame squashed to 640x640.
+        metrics_port (int): Port of the local Prometheus metrics endpoint, or 0 to not serve metrics.
+        keep_latest (bool): Whether to process only the newest frame of every stream, or every frame as when
+            replaying recorded clips.
+        reports (bool): Whether to store the counts and run the scheduled reports.
+        latencies (list): List the latency in seconds of every frame, from capture until it is counted, is
+            appended to, or None.
+        workers (int): Number of inference processes, or 0 to run capture and inference in threads.
+        capture_buffer (int): Maximum number of decoded frames of a live stream waiting for the inference stage,
+            the oldest being dropped when a new one arrives.
+        hair_model: Hair colour classification model of the second-stage hair check, or None to skip it.
+        startup (Startup_Timer): Timer of the startup phases, reported once the first frame is counted, or None.
+
+    Returns:
+        None
+    """
+
+    # Build the class ID to compliance category table once
+    class_table = load_class_table(class_path)
+
+    # Detect on a letterboxed region around each area, at the input size of the model
+    for camera in cameras:
+        camera.crop = Crop_Region(camera.zone, imgsz=imgsz) if crop else None
+
+    # Hair colour classifier shared by all cameras, each caching the results of its own tracked people
+    hair_classifier = Hair_Classifier(hair_model) if hair_model is not None else None
+    for camera in cameras:
+        camera.hair = Hair_Check(hair_classifier) if hair_classifier is not None else None
+
+    # Run the detector on every k-th frame only while it is slower than the 20 FPS of the cameras
+    skipper = Frame_Skipper(frame_interval=1 / 20.0, max_skip=max_skip)
+    detect_meter = Stage_Meter("detect")
+
+    resize_seconds = STAGE_SECONDS.labels(stage="resize")
+    predict_seconds = STAGE_SECONDS.labels(stage="predict")
+    frame_seconds = STAGE_SECONDS.labels(stage="frame")
+
+    def infer(batch):
+        # Resize the newest frame of every camera
+        with resize_seconds.time():
+            frames = [cv2.resize(frame_func, (640, 640)) for _, frame_func, _ in batch]
+
+        # Run the detector on the frames with motion, cutting the regions around the areas from the original
+        # frames in crop mode
+        batch_cameras = [cameras[index] for index, _, _ in batch]
+        moving, results, latency = detect_batch(
+            model, frames, skipper, imgsz,
+            gates=[camera.gate for camera in batch_cameras] if motion_gate else None,
+            crops=[camera.crop for camera in batch_cameras] if crop else None,
+            sources=[frame_func for _, frame_func, _ in batch])
+
+        if latency is not None:
+            predict_seconds.observe(latency)
+            detect_meter.tick(sum(result is not None for result in results))
+
+        return [(cameras[index], frame_func, result, moving_func, frame_time)
+                for (index, _, frame_time), frame_func, result, moving_func in zip(batch, frames, results, moving)]
+
+    # Warm the models up before any stream is opened, every inference process warming up its own model
+    if not workers:
+        warm_up(model, imgsz, batch=len(cameras))
+    if hair_classifier is not None:
+        hair_classifier.warm_up()
+
+    # Import the solver of the trackers now instead of on the first frame
+    hungarian_solver()
+    if startup is not None:
+        startup.mark("warm-up")
+
+    pool = None
+    inference_stage = None
+    if workers:
+        # Capture and inference processes, passing frames through shared memory slots
+        for camera in cameras:
+            camera.start(record=record, queue_size=queue_size, queue_policy=queue_policy, pre_roll=pre_roll,
+                         post_roll=post_roll, capture=False)
+        pool = Worker_Pool(cameras, model, workers, keep_latest=keep_latest, imgsz=imgsz, motion_gate=motion_gate,
+                           max_skip=max_skip, crop=crop)
+        pool.start()
+        next_batch = pool.get
+        stage_meters = pool.meters
+        if startup is not None:
+            startup.mark("workers")
+    else:
+        # Capture stage: one grabber per camera, all waking the batched inference stage
+        condition = threading.Condition()
+        for camera in cameras:
+            camera.start(condition, record=record, queue_size=queue_size, queue_policy=queue_policy,
+                         pre_roll=pre_roll, post_roll=post_roll, keep_latest=keep_latest,
+                         buffer_size=capture_buffer)
+        collector = Batch_Collector([camera.grabber for camera in cameras], condition)
+
+        # Inference stage: results are handed to the annotate stage through a bounded queue
+        inference_queue = queue.Queue(maxsize=2)
+        inference_stage = Pipeline_Stage("inference", infer, collector, inference_queue, size=len)
+        inference_stage.start()
+        next_batch = inference_queue.get
+        stage_meters = [camera.grabber.meter for camera in cameras] + [inference_stage.meter, detect_meter]
+
+    # Throughput meters of every stage
+    annotate_meter = Stage_Meter("annotate")
+    meters = (stage_meters + [annotate_meter] +
+              [camera.encode_meter if camera.clip_recorder is None else camera.clip_recorder.meter
+               for camera in cameras])
+
+    # Serve the stage latencies, dropped frames, Sheets errors and counts on a local metrics endpoint
+    metrics_server = None
+    if metrics_port:
+        try:
+            metrics_server = Metrics_Server(REGISTRY, metrics_port)
+            metrics_server.start()
+            print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+        except OSError as e:
+            # Counting goes on without the endpoint, the metrics are still logged
+            print(f"An error occurred: Unable to serve metrics on port {metrics_port}: {e}")
+
+    # Interval in seconds between throughput reports
+    report_interval = 10.0
+    last_report = time.perf_counter()
+
+    def store_counts(when=None):
+        # Append the changes of the counts to the store, by default to the minute that just ended
+        if when is None:
+            when = datetime.now() - timedelta(minutes=1)
+        for camera in cameras:
+            store.add(camera.name, camera.counted_ids.take_changes(), when)
+
+    def hourly_report(date_cell, compliant_cell, non_compliant_cell):
+        # Report the counts of all cameras for the hour that ended and start counting the next hour
+        counts = sum(camera.take_counts() for camera in cameras)
+        google_sheet_raw_data(date_cell, compliant_cell, non_compliant_cell, int(counts[0] + counts[1]),
+                              int(counts[2]))
+
+    def total_report():
+        # Calculate the totals of the day from the store, including the counts of the current minute
+        now = datetime.now()
+        store_counts(now)
+        totals = store.totals(now.replace(hour=0, minute=0, second=0, microsecond=0), now + timedelta(minutes=1))
+        google_sheet_total_data(totals['bsufcomply'] + totals['bsumcomply'], totals['bsunoncomply'])
+
+    def export_reports():
+        # Save the hourly counts of the day and the daily counts of the week so far from the store
+        now = datetime.now()
+        store_counts(now)
+        store.export_day(now, f"SMARTVIEW-{now.strftime('%Y-%m-%d')}.xlsx")
+        store.export_week(now, f"SMARTVIEW-{now.strftime('%G-W%V')}.xlsx")
+
+    # Local store of the counts of every camera per minute, and the hourly and end of day reports run from a
+    # timer thread, separate from the frame loop
+    store = None
+    scheduler = None
+    if reports:
+        store = Count_Store(store_path)
+        scheduler = Report_Scheduler(report_jobs(hourly_report, total_report, export_reports, clear_google_sheet_data,
+                                                 store_counts=store_counts))
+        scheduler.start()
+
+    while True:
+        # Wait for the next batch of inference results
+        batch = next_batch()
+
+        # Stop when the capture and inference stages have ended
+        if batch is END_OF_STREAM:
             break
 
-    # Release resources
-    cap.release()
-    out.release()
+        for camera, frame, result, moving, frame_time in batch:
+            bbox_idx = camera.update(result, class_table, moving)
+
+            # Report how long it took from the start of the process to the first counted frame
+            if startup is not None:
+                startup.mark("first frame")
+                print(startup.report())
+                startup = None
+
+            # Start or extend a clip when a new non-compliant object is counted
+            if camera.clip_recorder is not None and camera.new_event:
+                camera.clip_recorder.trigger()
+
+            # Decide whether this frame is displayed or recorded, and skip all rendering otherwise
+            decimated = annotate_every > 0 and camera.frame_count % annotate_every == 0
+            show_frame = display and decimated
+            if record == 'events':
+                record_frame = camera.clip_recorder.recording
+            else:
+                record_frame = record == 'all' and decimated
+
+            annotated_frame = None
+            if show_frame or record_frame:
+                with camera.stage_seconds["annotate"].time():
+                    annotated_frame = camera.annotate(frame, result, bbox_idx)
+                annotate_meter.tick()
+
+            with camera.stage_seconds["enqueue"].time():
+                if camera.clip_recorder is not None:
+                    # Outside of clips the pre-roll buffer keeps the raw frame unless it was annotated anyway
+                    camera.clip_recorder.add(annotated_frame if annotated_frame is not None else frame)
+                elif record_frame:
+                    camera.frame_queue.offer(annotated_frame)
+
+            # Display the annotated frame in a window titled after the camera
+            if show_frame:
+                cv2.imshow(f"SMARTVIEW - {camera.name}", annotated_frame)
+
+            # Measure the latency of the frame from capture until it has been counted and handed on
+            latency = time.perf_counter() - frame_time
+            frame_seconds.observe(latency)
+            if latencies is not None:
+                latencies.append(latency)
+
+        # Periodically report the throughput of each stage to find the one limiting FPS
+        if time.perf_counter() - last_report >= report_interval:
+            print(throughput_report(meters))
+            if pool is not None:
+                print(pool.report())
+            elif skipper.latency is not None:
+                print(f"Detector every {skipper.k} frames, latency {skipper.latency * 1000:.0f} ms")
+            print(REGISTRY.log_line())
+            for camera in cameras:
+                if camera.out is not None:
+                    print(camera.frame_queue.report(f"encode {camera.name}"))
+                if camera.clip_recorder is not None:
+                    print(camera.clip_recorder.frame_queue.report(f"clips {camera.name}"))
+            last_report = time.perf_counter()
 
-    # Signal the save thread to stop
-    frame_queue.put(None)
-    save_thread.join()
+        # Wait for a key press event, if the pressed key is ESC (key code 27), break the loop
+        if display and cv2.waitKey(1) & 0xFF == 27:
+            break
+
+    # Stop the report scheduler and the inference stage
+    if scheduler is not None:
+        scheduler.stop()
+    if pool is not None:
+        pool.join()
+    else:
+        inference_stage.stop()
+        for camera in cameras:
+            camera.grabber.stop()
+        inference_stage.join()
+
+    # Stop the capture and encode threads of every camera
+    for camera in cameras:
+        camera.stop()
+
+    # Store the counts of the last minute
+    if store is not None:
+        store_counts(datetime.now())
+        store.close()
+
+    if metrics_server is not None:
+        metrics_server.stop()
 
     # Close all OpenCV windows
-    cv2.destroyAllWindows()
+    if display:
+        cv2.destroyAllWindows()
 
 
 def main():
     """
-    Main function to process video stream using YOLO object detection model and track objects.
+    Main function to process the camera streams using a shared YOLO object detection model and track objects.
     """
 
-    # Path to the video stream
-    stream_path = 'haircolorlorenze.mp4'
+    # Parse run mode options from the command line
+    parser = argparse.ArgumentParser(description="SMARTVIEW uniform compliance monitoring")
+    parser.add_argument('--headless', action='store_true',
+                        help="run without a display window")
+    parser.add_argument('--annotate-every', type=int, default=1,
+                        help="annotate, display and record only every n-th frame, 0 to never annotate")
+    parser.add_argument('--record', choices=['all', 'events', 'off'], default='all',
+                        help="record all annotated frames, clips around non-compliance events, or nothing")
+    parser.add_argument('--pre-roll', type=float, default=3.0,
+                        help="seconds recorded before a non-compliant student is counted")
+    parser.add_argument('--post-roll', type=float, default=3.0,
+                        help="seconds recorded after a non-compliant student is counted")
+    parser.add_argument('--queue-size', type=int, default=32,
+                        help="maximum number of frames waiting to be encoded per camera")
+    parser.add_argument('--queue-policy', choices=Frame_Queue.POLICIES, default='block',
+                        help="what to do with a new frame when the encode queue is full")
+    parser.add_argument('--store', default='smartview_counts.db',
+                        help="path of the SQLite database storing the counts")
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch',
+                        help="inference backend, exported ONNX and OpenVINO models run faster on CPU")
+    parser.add_argument('--model-size', choices=MODEL_SIZES, default='l',
+                        help="size of the detection model")
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32',
+                        help="weight precision of exported models")
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help="input resolution of the model")
+    parser.add_argument('--calibration-data', default='BSU2CLASS/data.yaml',
+                        help="dataset YAML used to calibrate INT8 OpenVINO models when exporting them")
+    parser.add_argument('--calibration-clip',
+                        help="video clip used to calibrate INT8 ONNX models when exporting them")
+    parser.add_argument('--crop', action='store_true',
+                        help="run the detector at --imgsz on a letterboxed region around the area only")
+    parser.add_argument('--metrics-port', type=int, default=9108,
+                        help="port of the local Prometheus metrics endpoint, 0 to disable it")
+    parser.add_argument('--no-motion-gate', action='store_true',
+                        help="run the detector even while nothing moves around the area")
+    parser.add_argument('--max-skip', type=int, default=4,
+                        help="largest number of frames per inference when the detector is slower than the cameras")
+    parser.add_argument('--hair-model',
+                        help="hair colour classification model, to count non-standard hair as non-compliant")
+    parser.add_argument('--capture-buffer', type=int, default=1,
+                        help="decoded frames buffered per live stream, the oldest dropped when it is full")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="number of inference processes, each camera captured in its own process, 0 for threads")
+    parser.add_argument('--config', default=CONFIG_PATH,
+                        help="camera config with the stream, area and counting line of every camera")
+    args = parser.parse_args()
+
+    # Name, video stream, area of interest and optional counting line of every camera, as saved by draw_area.py
+    streams = load_cameras(args.config)
 
     # Path to the file containing class labels
     class_path = 'smartview_classes.txt'
 
-    # Initialize YOLO object detection model with pre-trained weights
-    model = YOLO('best-l.pt')
+    # Initialize YOLO object detection model with pre-trained weights on the chosen backend, shared by all cameras
+    if args.workers:
+        # Export the model once, and let every inference process load its own copy
+        ensure_model(args.model_size, args.backend, args.precision, args.imgsz, args.calibration_data,
+                     args.calibration_clip)
+        model = partial(load_model, args.model_size, args.backend, args.precision, args.imgsz)
+    else:
+        model = load_model(args.model_size, args.backend, args.precision, args.imgsz, args.calibration_data,
+                           args.calibration_clip)
 
-    # Initialize object trackers for different categories
-    bsufcomply_tracker = Object_Tracker()
-    bsumcomply_tracker = Object_Tracker()
-    bsunoncomply_tracker = Object_Tracker()
+    # Load the optional hair colour classifier
+    hair_model = load_hair_model(args.hair_model) if args.hair_model else None
+    startup.mark("model")
 
     # Get current date
     current_date = datetime.now().strftime("%Y-%m-%d")
@@ -415,12 +740,22 @@ def main():
     # Get current time
     current_time = time.strftime("%H-%M-%S")
 
-    # Define output file name
-    output_file_name = f"SMARTVIEW-{current_time}-{current_date}.mp4"
-
-    # Create a thread to process the video stream
-    video_thread = threading.Thread(target=process_video, args=(
-        stream_path, class_path, model, bsufcomply_tracker, bsumcomply_tracker, bsunoncomply_tracker, output_file_name))
+    # Create the per-camera state, each with its own trackers, counts and output file
+    cameras = [Camera_Stream(name, stream_path, area, f"SMARTVIEW-{name}-{current_time}-{current_date}.mp4",
+                             line)
+               for name, stream_path, area, line in streams]
+
+    # Create a thread to process the video streams
+    video_thread = threading.Thread(target=process_video, args=(cameras, class_path, model),
+                                    kwargs=dict(display=not args.headless, annotate_every=args.annotate_every,
+                                                record=args.record, queue_size=args.queue_size,
+                                                queue_policy=args.queue_policy, pre_roll=args.pre_roll,
+                                                post_roll=args.post_roll, store_path=args.store,
+                                                imgsz=args.imgsz, motion_gate=not args.no_motion_gate,
+                                                max_skip=args.max_skip, crop=args.crop,
+                                                metrics_port=args.metrics_port, workers=args.workers,
+                                                capture_buffer=args.capture_buffer, hair_model=hair_model,
+                                                startup=startup))
 
     # Start the video processing thread
     video_thread.start()
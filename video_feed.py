@@ -13,10 +13,8 @@ while cap.isOpened():
     # Read a frame from the video
     success, frame = cap.read()
 
-    frame = cv2.resize(frame, (640, 640))
-
     if success:
-        # Run YOLOv8 inference on the frame
+        # Run YOLOv8 inference on the frame, letterboxed by the model instead of squashed to 640x640
         results = model.predict(frame)
 
         # Visualize the results on the frame
@@ -0,0 +1,510 @@
+import os
+import cv2
+import sys
+import time
+import queue
+import numpy as np
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+from detections import *
+from pipeline import *
+from roi import *
+from metrics import *
+from backends import warm_up
+
+# Shape of the resized frames passed between the processes
+FRAME_SHAPE = (640, 640, 3)
+
+# Stages timed in the capture processes, in the order of their histograms in shared memory
+CAPTURE_STAGES = ("read", "resize")
+
+
+class Frame_Slots:
+    """
+    Fixed number of frame buffers in shared memory, so frames move between processes without being pickled.
+
+    The slots are created once by the main process. Passing a Frame_Slots object to a child process only
+    sends the name of its shared memory block, which the child attaches to.
+
+    Attributes:
+        count (int): Number of slots.
+        shape (tuple): Shape of the frame held by every slot.
+        frames (numpy.ndarray): Array of shape (count,) + shape viewing the shared memory block.
+    """
+
+    def __init__(self, count, shape=FRAME_SHAPE, name=None):
+        """
+        Initialize Frame_Slots, creating a new shared memory block or attaching to an existing one.
+
+        Args:
+            count (int): Number of slots.
+            shape (tuple): Shape of the frame held by every slot.
+            name (str): Name of the shared memory block to attach to, or None to create one.
+        """
+        self.count = count
+        self.shape = tuple(shape)
+        self.owner = name is None
+
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=count * int(np.prod(self.shape)))
+        elif sys.version_info >= (3, 13):
+            # Leave the block to the resource tracker of the process that created it
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+
+        self.frames = np.ndarray((count,) + self.shape, np.uint8, buffer=self.memory.buf)
+
+    def __reduce__(self):
+        # Pickle only the name of the block, so a child process attaches to the same memory
+        return Frame_Slots, (self.count, self.shape, self.memory.name)
+
+    def close(self):
+        """
+        Detach from the shared memory block, and free it in the process that created it.
+        """
+        del self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def put_until_stopped(target_queue, item, stop):
+    """
+    Put an item on a bounded queue, giving up once the pipeline is stopped.
+
+    Args:
+        target_queue (multiprocessing.Queue): Queue to put the item on.
+        item: Item to put.
+        stop (multiprocessing.Event): Event set when the pipeline is stopped.
+
+    Returns:
+        bool: True if the item was queued, False if the pipeline was stopped first.
+    """
+    while not stop.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def share_stage_times(values, stage_times, camera_index):
+    """
+    Copy the bucket counts and sums of the stage histograms of a capture process into shared memory, where the
+    main process adds them to its own histograms.
+
+    Args:
+        values (list): Histogram_Value of each stage in CAPTURE_STAGES.
+        stage_times (multiprocessing.Array): Bucket counts followed by the sum of every stage of every camera.
+        camera_index (int): Index of the camera.
+    """
+    shared = []
+    for value in values:
+        counts, seconds = value.snapshot()
+        shared.extend(counts + [seconds])
+
+    offset = camera_index * len(shared)
+    with stage_times.get_lock():
+        stage_times[offset:offset + len(shared)] = shared
+
+
+def capture_worker(camera_index, stream_path, slots, free_slots, frames, dropped, lags, stage_times, stop,
+                   keep_latest=True):
+    """
+    Capture process: read a video stream, resize every frame straight into a free shared memory slot and pass
+    the slot index on to the inference process.
+
+    Live streams never wait for a free slot, a frame is dropped instead, and are reopened with backoff when
+    they fail. Recorded files wait, so every frame is processed.
+
+    Args:
+        camera_index (int): Index of the camera.
+        stream_path (str): Path or URL of the input video stream.
+        slots (Frame_Slots): Shared memory slots of the camera.
+        free_slots (multiprocessing.Queue): Indices of the slots of the camera that are free.
+        frames (multiprocessing.Queue): Queue of (camera_index, slot, frame_time) tuples read by the inference
+            process, ended by (camera_index, None, None).
+        dropped (multiprocessing.Array): Number of frames dropped per camera.
+        lags (multiprocessing.Array): Decode lag in seconds per camera.
+        stage_times (multiprocessing.Array): Bucket counts and sums of the capture stages per camera.
+        stop (multiprocessing.Event): Event set when the pipeline is stopped.
+        keep_latest (bool): Whether to drop frames while no slot is free, or wait for one.
+    """
+    reader = Stream_Reader(stream_path, f"capture {camera_index}", stop=stop)
+    resize_seconds = STAGE_SECONDS.labels(stage="resize")
+    stage_values = [reader.read_seconds, resize_seconds]
+
+    while not stop.is_set():
+        frame = reader.read()
+        if frame is None:
+            break
+        frame_time = time.perf_counter()
+        if reader.lag is not None:
+            lags[camera_index] = reader.lag
+        share_stage_times(stage_values, stage_times, camera_index)
+
+        # Take a free slot, or drop the frame of a live stream while the later stages hold all slots
+        slot = None
+        while slot is None and not stop.is_set():
+            try:
+                slot = free_slots.get_nowait() if keep_latest else free_slots.get(timeout=0.1)
+            except queue.Empty:
+                if keep_latest:
+                    break
+        if slot is None:
+            with dropped.get_lock():
+                dropped[camera_index] += 1
+            continue
+
+        with resize_seconds.time():
+            cv2.resize(frame, FRAME_SHAPE[1::-1], dst=slots.frames[slot])
+        frames.put((camera_index, slot, frame_time))
+
+    share_stage_times(stage_values, stage_times, camera_index)
+    frames.put((camera_index, None, None))
+    reader.close()
+    slots.close()
+
+
+def inference_worker(worker_index, cameras, slots, free_slots, frames, results, dropped, stop, load, imgsz=640,
+                     motion_gate=True, max_skip=4, crop=False, keep_latest=True, threads=None):
+    """
+    Inference process: load the model and run it in batches on the newest frame of each of its cameras.
+
+    Only the detections, the slot indices and the capture times of the frames are passed on to the main
+    process, which tracks, counts and annotates them.
+
+    Args:
+        worker_index (int): Index of the inference process.
+        cameras (dict): Dictionary mapping the index of every camera of this process to its area polygon.
+        slots (dict): Dictionary mapping camera indices to their Frame_Slots.
+        free_slots (dict): Dictionary mapping camera indices to the queue of their free slot indices.
+        frames (multiprocessing.Queue): Queue of (camera_index, slot, frame_time) tuples from the capture
+            processes of this process's cameras.
+        results (multiprocessing.Queue): Queue of messages to the main process: ('names', names) once the model
+            is loaded and warmed up, ('batch', items, latency, k) per batch and ('end', worker_index) at the end.
+        dropped (multiprocessing.Array): Number of frames dropped per camera.
+        stop (multiprocessing.Event): Event set when the pipeline is stopped.
+        load (callable): Picklable function without arguments returning the detection model.
+        imgsz (int): Input resolution of the model.
+        motion_gate (bool): Whether to skip the detector while nothing moves around the area of a camera.
+        max_skip (int): Largest number of frames per inference when the detector is slower than the cameras.
+        crop (bool): Whether to run the detector on a letterboxed region around each area.
+        keep_latest (bool): Whether to process only the newest frame of every camera, or every frame.
+        threads (int): Number of threads the inference libraries may use, or None for their default.
+    """
+    # Share the cores between the inference processes instead of every library using all of them
+    if threads is not None:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        cv2.setNumThreads(threads)
+
+    # Load and warm the model up before the capture processes are started
+    model = load()
+    warm_up(model, imgsz, batch=len(cameras))
+    results.put(('names', dict(model.names)))
+
+    zones = {index: Zone(area) for index, area in cameras.items()}
+    gates = {index: Motion_Gate(zone) for index, zone in zones.items()}
+    crops = {index: Crop_Region(zone, imgsz=imgsz) for index, zone in zones.items()} if crop else {}
+    skipper = Frame_Skipper(frame_interval=1 / 20.0, max_skip=max_skip)
+
+    # Frames of every camera waiting for inference, and the cameras whose stream has not ended
+    pending = {index: deque() for index in cameras}
+    active = set(cameras)
+
+    while not stop.is_set():
+        # Wait for a frame unless some are already waiting, then take all frames that have arrived
+        arrived = []
+        if not any(pending.values()):
+            if not active:
+                break
+            try:
+                arrived.append(frames.get(timeout=0.1))
+            except queue.Empty:
+                continue
+        while True:
+            try:
+                arrived.append(frames.get_nowait())
+            except queue.Empty:
+                break
+
+        for camera_index, slot, frame_time in arrived:
+            if slot is None:
+                active.discard(camera_index)
+                continue
+            waiting = pending[camera_index]
+            if keep_latest and waiting:
+                # Replace the older frame, which was never read, with the newest one
+                free_slots[camera_index].put(waiting.popleft()[0])
+                with dropped.get_lock():
+                    dropped[camera_index] += 1
+            waiting.append((slot, frame_time))
+
+        # Collect the next frame of every camera with frames waiting
+        batch = [(index, *pending[index].popleft()) for index in cameras if pending[index]]
+        if not batch:
+            continue
+        frame_views = [slots[index].frames[slot] for index, slot, _ in batch]
+
+        # Run the detector on the frames with motion, cutting the regions around the areas from the resized
+        # frames in the slots in crop mode
+        moving, predicted, latency = detect_batch(
+            model, frame_views, skipper, imgsz,
+            gates=[gates[index] for index, _, _ in batch] if motion_gate else None,
+            crops=[crops[index] for index, _, _ in batch] if crop else None)
+        data = [to_numpy(result.boxes.data) if result is not None else None for result in predicted]
+
+        items = [(index, slot, frame_time, data_func, moving_func)
+                 for (index, slot, frame_time), data_func, moving_func in zip(batch, data, moving)]
+        if not put_until_stopped(results, ('batch', items, latency, skipper.k), stop):
+            break
+
+    put_until_stopped(results, ('end', worker_index), stop)
+    for camera_slots in slots.values():
+        camera_slots.close()
+
+
+class Worker_Pool:
+    """
+    Capture, inference and post-processing split across processes, so they do not compete for one GIL.
+
+    Every camera has a capture process that decodes and resizes its frames into preallocated shared memory
+    slots. The cameras are divided over one or more inference processes, which each load the model and pass
+    only the detections and slot indices of their batches on. The main process tracks, counts and annotates
+    the batches returned by get, copying each frame out of its slot and freeing the slot right away.
+
+    In crop mode the region around the area is cut from the resized frame in the slot, not from the original
+    frame.
+
+    Attributes:
+        cameras (list): List of Camera_Stream objects.
+        names (dict): Dictionary mapping class IDs to class names, received from the inference processes.
+        meters (list): Throughput meters of the frames and detections received by the main process.
+    """
+
+    def __init__(self, cameras, load, workers=2, slots=4, keep_latest=True, imgsz=640, motion_gate=True,
+                 max_skip=4, crop=False):
+        """
+        Initialize Worker_Pool and allocate the shared memory slots of every camera.
+
+        Args:
+            cameras (list): List of Camera_Stream objects.
+            load (callable): Picklable function without arguments returning the detection model, called in every
+                inference process.
+            workers (int): Number of inference processes, at most one per camera.
+            slots (int): Number of shared memory slots per camera.
+            keep_latest (bool): Whether to process only the newest frame of every camera, or every frame.
+            imgsz (int): Input resolution of the model.
+            motion_gate (bool): Whether to skip the detector while nothing moves around the area of a camera.
+            max_skip (int): Largest number of frames per inference when the detector is slower than the cameras.
+            crop (bool): Whether to run the detector on a letterboxed region around each area.
+        """
+        self.cameras = cameras
+        self.names = {}
+        self.meters = [Stage_Meter("inference"), Stage_Meter("detect")]
+
+        # Spawn fresh interpreters, as the capture and inference libraries are not safe to fork
+        context = multiprocessing.get_context('spawn')
+        workers = min(max(int(workers), 1), len(cameras))
+        threads = max((os.cpu_count() or 1) // workers, 1)
+
+        self.slots = [Frame_Slots(max(int(slots), 2)) for _ in cameras]
+        self.free_slots = [context.Queue() for _ in cameras]
+        for camera_slots, free_slots in zip(self.slots, self.free_slots):
+            for slot in range(camera_slots.count):
+                free_slots.put(slot)
+
+        self.dropped = context.Array('q', len(cameras))
+        self.dropped_seen = [0] * len(cameras)
+        self.dropped_frames = [DROPPED_FRAMES.labels(queue=f"capture {camera.name}") for camera in cameras]
+        self.lags = context.Array('d', len(cameras))
+        self.decode_lags = [DECODE_LAG.labels(stream=f"capture {camera.name}") for camera in cameras]
+        self.stage_seconds = [STAGE_SECONDS.labels(stage=stage) for stage in CAPTURE_STAGES]
+        self.stage_size = len(STAGE_SECONDS.buckets) + 2
+        self.stage_times = context.Array('d', len(cameras) * len(CAPTURE_STAGES) * self.stage_size)
+        self.stage_times_seen = [0.0] * len(self.stage_times)
+        self.stop_event = context.Event()
+        self.results = context.Queue(maxsize=2 * workers)
+        self.predict_seconds = STAGE_SECONDS.labels(stage="predict")
+        self.skip = {}
+        self.latency = {}
+
+        # Divide the cameras over the inference processes. The queues are kept here, as a started process no
+        # longer holds its arguments and the queues would be freed while the children still attach to them
+        self.frame_queues = [context.Queue() for _ in range(workers)]
+        self.inference_processes = []
+        for worker_index in range(workers):
+            indices = range(worker_index, len(cameras), workers)
+            self.inference_processes.append(context.Process(
+                target=inference_worker, name=f"inference {worker_index}", daemon=True,
+                args=(worker_index, {index: cameras[index].area for index in indices},
+                      {index: self.slots[index] for index in indices},
+                      {index: self.free_slots[index] for index in indices}, self.frame_queues[worker_index],
+                      self.results, self.dropped, self.stop_event, load),
+                kwargs=dict(imgsz=imgsz, motion_gate=motion_gate, max_skip=max_skip, crop=crop,
+                            keep_latest=keep_latest, threads=threads)))
+
+        self.capture_processes = [context.Process(
+            target=capture_worker, name=f"capture {camera.name}", daemon=True,
+            args=(index, camera.stream_path, self.slots[index], self.free_slots[index],
+                  self.frame_queues[index % workers], self.dropped, self.lags, self.stage_times, self.stop_event),
+            kwargs=dict(keep_latest=keep_latest)) for index, camera in enumerate(cameras)]
+
+        self.ended = 0
+
+    def start(self):
+        """
+        Start the inference processes, and the capture processes once every model is loaded and warmed up, so
+        the streams are only opened when their frames can be predicted.
+        """
+        for process in self.inference_processes:
+            process.start()
+
+        ready = 0
+        while ready < len(self.inference_processes):
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                # Stop waiting for an inference process that failed, get reports it
+                if self.failed():
+                    break
+                continue
+
+            if message[0] == 'names':
+                self.names.update(message[1])
+                ready += 1
+
+        for process in self.capture_processes:
+            process.start()
+
+    def failed(self):
+        """
+        Return the inference processes that exited with an error, for example failing to load the model.
+
+        Returns:
+            failed (list): List of the failed processes.
+        """
+        return [process for process in self.inference_processes if process.exitcode not in (None, 0)]
+
+    def get(self):
+        """
+        Wait for the next batch of inference results.
+
+        Returns:
+            batch (list): List of (camera, frame, result, moving, frame_time) tuples, with result None for frames
+                not run through the detector, or END_OF_STREAM once every inference process has ended.
+        """
+        while self.ended < len(self.inference_processes):
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                # Stop waiting for an inference process that failed, for example to load the model
+                failed = self.failed()
+                if failed:
+                    print(f"An error occurred: {failed[0].name} process exited with code {failed[0].exitcode}")
+                    return END_OF_STREAM
+                continue
+
+            kind = message[0]
+            if kind == 'names':
+                self.names.update(message[1])
+            elif kind == 'end':
+                self.ended += 1
+            else:
+                return self.receive(message)
+
+        return END_OF_STREAM
+
+    def receive(self, message):
+        """
+        Turn a batch message of an inference process into frames and results, freeing the slots.
+
+        Args:
+            message (tuple): ('batch', items, latency, k) message.
+
+        Returns:
+            batch (list): List of (camera, frame, result, moving, frame_time) tuples.
+        """
+        _, items, latency, k = message
+
+        batch = []
+        for camera_index, slot, frame_time, data, moving in items:
+            # Copy the frame out of its slot, so the slot is free for the capture process again
+            frame = self.slots[camera_index].frames[slot].copy()
+            self.free_slots[camera_index].put(slot)
+
+            result = Mapped_Result(frame, data, self.names) if data is not None else None
+            batch.append((self.cameras[camera_index], frame, result, moving, frame_time))
+            self.skip[self.cameras[camera_index].name] = k
+
+        self.meters[0].tick(len(items))
+        if latency is not None:
+            self.predict_seconds.observe(latency)
+            self.meters[1].tick(sum(item[3] is not None for item in items))
+            for camera_index, _, _, _, _ in items:
+                self.latency[self.cameras[camera_index].name] = latency
+
+        # Add the frames dropped and the decode lags of the capture and inference processes to the metrics
+        for index, dropped in enumerate(self.dropped[:]):
+            if dropped > self.dropped_seen[index]:
+                self.dropped_frames[index].inc(dropped - self.dropped_seen[index])
+                self.dropped_seen[index] = dropped
+        for decode_lag, lag in zip(self.decode_lags, self.lags[:]):
+            decode_lag.set(lag)
+
+        # Add the read and resize times of the capture processes to the stage histograms
+        with self.stage_times.get_lock():
+            stage_times = self.stage_times[:]
+        for offset in range(0, len(stage_times), self.stage_size):
+            shared = stage_times[offset:offset + self.stage_size]
+            seen = self.stage_times_seen[offset:offset + self.stage_size]
+            if shared != seen:
+                stage = (offset // self.stage_size) % len(CAPTURE_STAGES)
+                self.stage_seconds[stage].add([int(now - before) for now, before in zip(shared[:-1], seen[:-1])],
+                                              shared[-1] - seen[-1])
+                self.stage_times_seen[offset:offset + self.stage_size] = shared
+
+        return batch
+
+    def report(self):
+        """
+        Build a short report of the frame skipping of the inference processes.
+
+        Returns:
+            report (str): Report in the format "Detector every 2 frames, latency 80 ms (gate)", or an empty string
+                before the first inference.
+        """
+        return " | ".join(f"Detector every {self.skip[name]} frames, latency {latency * 1000:.0f} ms ({name})"
+                          for name, latency in sorted(self.latency.items()))
+
+    def stop(self):
+        """
+        Signal all processes to stop.
+        """
+        self.stop_event.set()
+
+    def join(self, timeout=5.0):
+        """
+        Wait for all processes to end and free the shared memory slots.
+
+        Args:
+            timeout (float): Number of seconds to wait for every process before terminating it.
+        """
+        self.stop_event.set()
+        for process in self.capture_processes + self.inference_processes:
+            deadline = time.perf_counter() + timeout
+            while process.is_alive() and time.perf_counter() < deadline:
+                # Keep draining the results, so no process waits to flush a full queue
+                try:
+                    self.results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+        for camera_slots in self.slots:
+            camera_slots.close()